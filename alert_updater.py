@@ -2,20 +2,330 @@
 
 """Update and trigger alerts."""
 
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+from collections import Counter
 from dotenv import load_dotenv
+from typing import Callable, Iterator, List, NamedTuple
 
+from common.database import BulkWriter
+from common.fetcher import Fetcher
+from common.jobs import Job, JobQueue
+from common.sessions import FetchError
 from models.alert import Alert
+from models.item import Item
+from models.model import Model
+from models.notification import Notification
+from models.price_history import PriceHistory
+from models.store import Store
 
-# Alert uses Mailgun to send email notifications. The Mailgun library requires
+# Notifications are sent with Mailgun. The Mailgun library requires
 # environment variables which have not yet been loaded, so load them here.
 load_dotenv()
 
-alerts = Alert.fetch_all()
 
-for alert in alerts:
-    alert.fetch_item_price()
-    alert.notify_if_price_reached()
-    #alert.json()
+class DueItem(NamedTuple):
+    """An item due for a price check and its price before the check."""
+    item: Item
+    previous_price: float
+
+
+def worker_id() -> str:
+    """Names this updater process uniquely among the workers sharing a db."""
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def due_items(worker: str, claim_size: int, lease_seconds: float,
+              writer: BulkWriter, stop: threading.Event) -> Iterator[DueItem]:
+    """Claims the items due for a price check.
+
+    Items are claimed a few at a time as the fetcher asks for them, so
+    several workers can share the due items without checking any of them
+    twice, and no item's lease runs down while it waits behind a long queue.
+    Items which no alert is watching are not fetched, only rescheduled and
+    released. Once stop is set, claimed items not yet handed out are
+    released for other workers to check.
+    """
+    while not stop.is_set():
+        batch = Item.claim_due(worker, claim_size, lease_seconds)
+        if not batch:
+            return
+
+        watched = Alert.watched(item._id for item in batch)
+
+        for position, item in enumerate(batch):
+            if stop.is_set():
+                for unstarted in batch[position:]:
+                    unstarted.release(worker, writer)
+                return
+
+            if item._id in watched:
+                yield DueItem(item, item.price)
+            else:
+                item.reschedule(changed=False)
+                item.save_to_db(writer)
+                item.release(worker, writer)
+
+        if len(batch) < claim_size:
+            return
+
+
+def price_found(item: Item, previous_price: float,
+                writer: BulkWriter) -> None:
+    """Acts on a successfully fetched price.
+
+    The item is rescheduled and queued for saving with its price history.
+    Alerts whose floor is above the price are asked to notify, which they
+    only do for news, and disarmed alerts the price has risen clear of are
+    re-armed.
+    """
+    price = item.price
+    triggered = Alert.triggered(item)
+
+    floors = [triggered[0].price_floor] if triggered else []
+    below = Alert.floor_below(item._id, price)
+    if below is not None:
+        floors.append(below)
+    closest = min(floors, key=lambda floor: abs(floor - price), default=None)
+
+    item.reschedule(price != previous_price, closest)
+    item.save_to_db(writer)
+
+    PriceHistory.record(item._id, price, writer)
+
+    for alert in triggered:
+        alert.price_reached(writer)
+    for alert in Alert.rearmed(item):
+        alert.rearm(writer)
+
+
+@JobQueue.handler('fetch_price')
+def fetch_first_price(item_id: str) -> None:
+    """Fetches the first price of an item added with a new alert.
+
+    The item is leased like the items of an update cycle, so a cycle and
+    the job never check it at once and queue the same notifications twice.
+    Nothing is fetched if a cycle holds the item or has found the price
+    already.
+    """
+    worker = worker_id()
+    item = Item.claim(item_id, worker)
+    if item is None:
+        return
+
+    with BulkWriter() as writer:
+        try:
+            if item.price is None:
+                item.fetch_price()
+                price_found(item, None, writer)
+        finally:
+            item.release(worker, writer)
+
+
+def claimed_jobs(worker: str, stop: threading.Event) -> Iterator[Job]:
+    """Claims ready jobs one at a time as they are asked for.
+
+    No further job is claimed once stop is set, so none is left claimed
+    but never run.
+    """
+    while not stop.is_set():
+        job = JobQueue.claim(worker)
+        if job is None:
+            return
+        yield job
+
+
+def drain_jobs(worker: str, stop: threading.Event) -> int:
+    """Runs queued jobs concurrently until none are ready.
+
+    Args:
+        worker: The name the worker claims jobs under.
+        stop: Once set, no further jobs are started.
+
+    Returns:
+        The number of jobs run.
+    """
+    job_count = 0
+
+    for job, run in Fetcher().run(JobQueue.run, claimed_jobs(worker, stop)):
+        job_count += 1
+        if not run.result():
+            print(f'Job {job.name} {job.id} failed on attempt '
+                  f'{job.attempts}.')
+
+    return job_count
+
+
+def run_cycle(worker: str, batch_size: int, lease_seconds: float,
+              stop: threading.Event) -> int:
+    """Checks the prices of every due item and triggers alerts.
+
+    Due items are claimed from the database most overdue first, as many at
+    a time as are fetched concurrently, so memory use stays flat however
+    many items exist. Each item's lease is released when it is written back,
+    or when the cycle is stopped before its fetch starts; the leases of a
+    worker which dies lapse on their own. Alerts are evaluated in the order
+    prices arrive, by queries on the alerts' (item_id, price_floor) index,
+    so finding the ones triggered costs the same however many alerts watch
+    the item. A failed fetch, or any other error checking an item, is recorded
+    against its item and the rest of the cycle carries on. Each item is
+    rescheduled according to how volatile its price is and how close it is
+    to an alert, then written back in bulk with its price history.
+    Notifications for triggered alerts are queued in the outbox and sent at
+    the end of the cycle, so Mailgun never slows or breaks fetching.
+
+    Args:
+        worker: The name the worker claims items under.
+        batch_size: The number of writes sent to the database per batch.
+        lease_seconds: How long claimed items are held before other workers
+            may claim them.
+        stop: Once set, no further items are started, unstarted items are
+            released, and the cycle ends after the fetches in flight.
+
+    Returns:
+        The number of items fetched.
+    """
+    for store in Store.fetch_all():
+        store.configure_session()
+
+    item_count = 0
+    price_sources = Counter()
+
+    fetcher = Fetcher()
+
+    with BulkWriter(batch_size) as writer:
+        pending = due_items(worker, fetcher.max_workers, lease_seconds,
+                            writer, stop)
+        fetches = fetcher.run(lambda due: due.item.fetch_price(), pending)
+
+        for due, fetch in fetches:
+            item_count += 1
+
+            try:
+                fetch.result()
+                error = None
+            except FetchError as e:
+                error = e
+            except Exception as e:
+                # An unexpected error must not end the cycle: the item would
+                # keep its next check, be claimed first once its lease
+                # lapsed, and end every later cycle too.
+                traceback.print_exc()
+                error = FetchError(f'Failed to check {due.item.url}: {e!r}')
+
+            if error is not None:
+                due.item.record_failure(error)
+                due.item.save_to_db(writer)
+                due.item.release(worker, writer)
+                print(error.message)
+                continue
+
+            price_found(due.item, due.previous_price, writer)
+            due.item.release(worker, writer)
+            price_sources[due.item.price_source] += 1
+
+    if price_sources:
+        print('Prices found by ' + ', '.join(
+            f'{source}: {count}'
+            for source, count in price_sources.most_common()))
+
+    # Notifications are only sent once the cycle's writes, which queued
+    # them, have been flushed.
+    sent = Notification.send_pending(worker)
+    if sent:
+        print(f'Sent {sent} notifications.')
+
+    return item_count
+
+
+def guarded(step: Callable[[], object], name: str) -> None:
+    """Runs one step of the daemon, reporting rather than raising its errors.
+
+    A database failover or a bug hit by one cycle must not end the daemon,
+    so the error is printed and the daemon carries on with its next step.
+
+    Args:
+        step: The step to run.
+        name: What the step does, for the error report.
+    """
+    try:
+        step()
+    except Exception:
+        print(f'{name} failed:')
+        traceback.print_exc()
+
+
+def main() -> None:
+    """Runs a single update cycle, or runs cycles until stopped."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--daemon', action='store_true',
+                        help='keep running update cycles and queued jobs '
+                             'until SIGTERM')
+    parser.add_argument('--interval', type=float,
+                        default=float(os.environ.get('UPDATER_INTERVAL', 60)),
+                        help='seconds between the starts of cycles in daemon '
+                             'mode')
+    parser.add_argument('--job-poll', type=float,
+                        default=float(os.environ.get('UPDATER_JOB_POLL', 2)),
+                        help='seconds between checks for queued jobs in '
+                             'daemon mode')
+    args = parser.parse_args()
+
+    batch_size = int(os.environ.get('UPDATER_BATCH_SIZE', Item.BATCH_SIZE))
+    lease_seconds = float(os.environ.get('UPDATER_LEASE_SECONDS',
+                                         Item.LEASE_SECONDS))
+    worker = worker_id()
+    stop = threading.Event()
+
+    Model.ensure_indexes()
+    PriceHistory.ensure_indexes()
+    JobQueue.ensure_indexes()
+
+    if not args.daemon:
+        drain_jobs(worker, stop)
+        if not run_cycle(worker, batch_size, lease_seconds, stop):
+            print('No watched items are due for a price check.')
+        return
+
+    # Cycles run one after another in this process, so they never overlap,
+    # and connection pools and caches stay warm between them. A signal lets
+    # the current cycle finish its in-flight fetches and flush its writes.
+    def shut_down(signum, frame):
+        print('Shutting down after the current cycle.')
+        stop.set()
+
+    signal.signal(signal.SIGTERM, shut_down)
+    signal.signal(signal.SIGINT, shut_down)
+
+    # Queued jobs and notifications are polled for between cycles, so first
+    # prices of new alerts arrive within seconds rather than at the next
+    # cycle, and failed notifications are retried when they are due. They
+    # are polled at least once after every cycle, so a backlog of due items
+    # which keeps cycles longer than the interval cannot starve them.
+    # Each step is guarded, so an error in one waits out the interval like
+    # any other cycle and the daemon retries it rather than exiting.
+    while not stop.is_set():
+        started = time.monotonic()
+        guarded(lambda: run_cycle(worker, batch_size, lease_seconds, stop),
+                'Update cycle')
+
+        while True:
+            guarded(lambda: drain_jobs(worker, stop), 'Running jobs')
+            guarded(lambda: Notification.send_pending(worker),
+                    'Sending notifications')
+
+            remaining = args.interval - (time.monotonic() - started)
+            if stop.is_set() or remaining <= 0:
+                break
+            stop.wait(min(args.job_poll, remaining))
+
 
-if not alerts:
-    print('No alerts have been created. Add an item and alert to begin.')
+if __name__ == '__main__':
+    main()
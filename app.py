@@ -8,6 +8,7 @@ from flask import Flask, render_template
 from controllers.alerts import alert_blueprint
 from controllers.stores import store_blueprint
 from controllers.users import user_blueprint
+from models.model import Model
 
 app = Flask(__name__)
 app.secret_key = os.urandom(64)
@@ -25,5 +26,7 @@ app.register_blueprint(alert_blueprint, url_prefix='/alerts')
 app.register_blueprint(store_blueprint, url_prefix='/stores')
 app.register_blueprint(user_blueprint, url_prefix='/users')
 
+Model.ensure_indexes()
+
 if __name__ == '__main__':
     app.run(debug=True)
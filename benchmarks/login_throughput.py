@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+"""Measure how logins under load affect the latency of other pages.
+
+Runs against a live server, for example one started with uwsgi. Several
+threads log in as fast as they can while others repeatedly fetch a cheap
+page, then the latency percentiles of both are reported. Compare runs with
+different PASSWORD_CONCURRENCY and PASSWORD_ROUNDS settings on the server,
+and a run with --logins 0 as the baseline. Logins turned away while the
+server is busy hashing are counted separately.
+
+    python benchmarks/login_throughput.py --url http://127.0.0.1:5000
+"""
+
+import argparse
+import threading
+import time
+import uuid
+
+import requests
+
+from typing import List
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Gets a percentile of a set of samples, by nearest rank."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def hammer(url: str, data: dict, stop: threading.Event,
+           samples: List[float], rejected: List[float] = None) -> None:
+    """Requests a URL repeatedly until stopped, recording each latency.
+
+    Logins answered with anything but the email address, such as the
+    server being too busy, are recorded in rejected instead.
+    """
+    session = requests.Session()
+    method = session.post if data else session.get
+
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = method(url, data=data)
+        response.raise_for_status()
+        elapsed = time.perf_counter() - started
+
+        if data and response.text != data['email']:
+            rejected.append(elapsed)
+        else:
+            samples.append(elapsed)
+
+
+def report(name: str, samples: List[float], duration: float) -> None:
+    """Prints the throughput and latency percentiles of a set of requests."""
+    if not samples:
+        print(f'{name:>8}: no requests completed')
+        return
+
+    print(f'{name:>8}: {len(samples) / duration:7.1f} req/s  '
+          f'p50 {percentile(samples, 0.50) * 1000:7.1f} ms  '
+          f'p99 {percentile(samples, 0.99) * 1000:7.1f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000',
+                        help='the base URL of the running app')
+    parser.add_argument('--logins', type=int, default=8,
+                        help='the number of threads logging in')
+    parser.add_argument('--probes', type=int, default=2,
+                        help='the number of threads fetching --path')
+    parser.add_argument('--path', default='/',
+                        help='the page whose latency is measured')
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='the seconds to run for')
+    parser.add_argument('--email',
+                        help='log in as an existing account instead of '
+                             'registering a new one')
+    parser.add_argument('--password', help='the existing account\'s password')
+    args = parser.parse_args()
+
+    base = args.url.rstrip('/')
+    if args.email:
+        credentials = {'email': args.email, 'password': args.password}
+    else:
+        credentials = {
+            'email': f'benchmark-{uuid.uuid4().hex[:8]}@example.com',
+            'password': uuid.uuid4().hex}
+        requests.post(f'{base}/users/register',
+                      data=credentials).raise_for_status()
+
+    stop = threading.Event()
+    logins: List[float] = []
+    rejected: List[float] = []
+    probes: List[float] = []
+    threads = [threading.Thread(target=hammer, daemon=True,
+                                args=(f'{base}/users/login', credentials,
+                                      stop, logins, rejected))
+               for _ in range(args.logins)]
+    threads += [threading.Thread(target=hammer, daemon=True,
+                                 args=(base + args.path, None, stop, probes))
+                for _ in range(args.probes)]
+
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    report('login', logins, args.duration)
+    report('rejected', rejected, args.duration)
+    report(args.path, probes, args.duration)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""Check that every model finder is served by an index.
+
+Runs explain() on the query behind each finder and exits with an error if
+any of them would scan a whole collection. Pass --create to create the
+declared indexes first.
+"""
+
+import sys
+
+from datetime import datetime
+from typing import Dict, Iterator
+
+from common.database import Database
+from common.jobs import JobQueue
+from models.alert import Alert
+from models.item import Item
+from models.model import Model
+from models.notification import Notification
+from models.price_history import PriceHistory
+from models.store import Store
+from models.user.user import User
+
+FINDERS = [
+    ('User.find_by_email', User._db_collection,
+     {'email': 'someone@example.com'}),
+    ('Alert.find_many(user_email)', Alert._db_collection,
+     {'user_email': 'someone@example.com'}),
+    ('Alert.page(user_email)', Alert._db_collection,
+     {'user_email': 'someone@example.com', '_id': {'$gt': '0' * 32}}),
+    ('Alert.watched', Alert._db_collection,
+     {'item_id': {'$in': ['0' * 32]}}),
+    ('Alert.triggered', Alert._db_collection,
+     {'item_id': '0' * 32, 'price_floor': {'$gt': 10.0}}),
+    ('Alert.rearmed', Alert._db_collection,
+     {'item_id': '0' * 32, 'armed': False, 'price_floor': {'$lte': 10.0}}),
+    ('Store.find_by_domain', Store._db_collection,
+     {'domain': {'$regex': '^https://www.example.com/'}}),
+    ('Item.find_or_create', Item._db_collection,
+     {'canonical_url': 'https://example.com/item'}),
+    ('Item.claim_due', Item._db_collection,
+     {'$and': [
+         {'$or': [{'next_check': {'$lte': datetime(2000, 1, 1)}},
+                  {'next_check': None}]},
+         {'$or': [{'lease_expires': {'$lte': datetime(2000, 1, 1)}},
+                  {'lease_expires': None}]},
+     ]}),
+    ('Notification.claim', Notification._db_collection,
+     {'status': {'$in': ['pending', 'sending']},
+      'send_after': {'$lte': datetime(2000, 1, 1)}}),
+    ('JobQueue.claim', JobQueue.COLLECTION,
+     {'status': {'$in': ['queued', 'running']},
+      'run_at': {'$lte': datetime(2000, 1, 1)}}),
+    ('PriceHistory.rollups', PriceHistory.ROLLUP_COLLECTION,
+     {'item_id': '0' * 32, 'period': 'day'}),
+    ('PriceHistory.points', PriceHistory.HISTORY_COLLECTION,
+     {'item_id': '0' * 32, 'day': {'$gte': datetime(2000, 1, 1)}}),
+]
+
+
+def stages(plan: Dict) -> Iterator[str]:
+    """Lists every stage in a query plan."""
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from stages(value)
+
+
+if __name__ == '__main__':
+    if '--create' in sys.argv:
+        Model.ensure_indexes()
+        PriceHistory.ensure_indexes()
+        JobQueue.ensure_indexes()
+
+    failures = 0
+
+    for name, collection, query in FINDERS:
+        plan = Database.explain(collection, query)['queryPlanner']
+        plan_stages = list(stages(plan['winningPlan']))
+
+        if 'COLLSCAN' in plan_stages:
+            failures += 1
+            print(f'FAIL {name}: {" -> ".join(plan_stages)}')
+        else:
+            print(f'ok   {name}: {" -> ".join(plan_stages)}')
+
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+"""In-memory caching."""
+
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+
+class TTLCache(object):
+    """A thread-safe, size limited read-through cache.
+
+    Entries expire ttl seconds after they are loaded. When the cache is full
+    the least recently used entry is evicted. A value whose load was under
+    way when the cache was cleared is returned but not stored, since it may
+    have been read before the change which cleared the cache.
+
+    Attributes:
+        max_size: The maximum number of entries held.
+        ttl: The number of seconds an entry stays fresh.
+        hits: The number of reads served from the cache.
+        misses: The number of reads which had to be loaded.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, load: Callable[[], Any]) -> Any:
+        """Gets an entry, loading and storing it if it is missing or stale.
+
+        Args:
+            key: The entry's key.
+            load: Called to produce the value on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        value = load()
+
+        with self._lock:
+            if generation != self._generation:
+                return value
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        return value
+
+    def clear(self) -> None:
+        """Discards every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Reports the hit and miss counters and the number of entries."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._entries)}
@@ -2,10 +2,15 @@
 """MongoDB database manager."""
 
 import os
+import threading
 import pymongo
 
 from dotenv import load_dotenv
-from pymongo.results import DeleteResult, InsertOneResult, UpdateResult
+from pymongo import ReturnDocument
+from pymongo.operations import IndexModel, UpdateOne
+from pymongo.results import (BulkWriteResult, DeleteResult, InsertOneResult,
+                             UpdateResult)
+from typing import Callable, Dict, List, Tuple
 
 # The database manager requires environment variables which have not yet
 # been loaded, so load them here.
@@ -24,30 +29,72 @@ class Database(object):
     DB = pymongo.MongoClient(URI).get_database()
 
     @staticmethod
-    def find_many(collection: str, query: dict) -> pymongo.cursor:
+    def find_many(collection: str, query: dict, projection: dict = None,
+                  batch_size: int = 0, sort: List = None) -> pymongo.cursor:
         """Fetches multiple documents from the database.
 
         Args:
             collection: The collection to fetch from.
             query: The search parameters.
+            projection: The fields to include or exclude, or None for all.
+            batch_size: The number of documents per network round trip, or 0
+                for the server's default.
+            sort: (field, direction) pairs to order the documents by.
 
         Returns:
             An iterable PyMongo Cursor pointing to the requested documents.
         """
-        return Database.DB[collection].find(query)
+        return Database.DB[collection].find(query, projection,
+                                            batch_size=batch_size, sort=sort)
 
     @staticmethod
-    def find_one(collection: str, query: dict) -> dict:
+    def distinct(collection: str, key: str, query: dict) -> List:
+        """Fetches the distinct values of a field among matching documents.
+
+        Args:
+            collection: The collection to search.
+            key: The field whose values to return.
+            query: The search parameters.
+
+        Returns:
+            Each value of the field, once.
+        """
+        return Database.DB[collection].distinct(key, query)
+
+    @staticmethod
+    def find_one(collection: str, query: dict,
+                 projection: dict = None) -> dict:
         """Fetches a single document from the database.
 
         Args:
             collection: The collection to fetch from.
             query: The search parameters.
+            projection: The fields to return. Defaults to every field.
 
         Returns:
             The first document encountered which matches the search parameters.
         """
-        return Database.DB[collection].find_one(query)
+        return Database.DB[collection].find_one(query, projection)
+
+    @staticmethod
+    def find_one_and_update(collection: str, query: dict, update: dict,
+                            sort: List = None, upsert: bool = False) -> dict:
+        """Atomically updates a single document and fetches it.
+
+        Args:
+            collection: The collection to update.
+            query: The search parameters.
+            update: The update operators to apply.
+            sort: (field, direction) pairs choosing which document to update
+                when several match.
+            upsert: Whether to insert a document when none match.
+
+        Returns:
+            The document after the update, or None if none matched.
+        """
+        return Database.DB[collection].find_one_and_update(
+            query, update, sort=sort, upsert=upsert,
+            return_document=ReturnDocument.AFTER)
 
     @staticmethod
     def insert_one(collection: str, document: dict) -> InsertOneResult:
@@ -59,6 +106,57 @@ class Database(object):
         """
         return Database.DB[collection].insert_one(document)
 
+    @staticmethod
+    def bulk_write(collection: str, operations: List) -> BulkWriteResult:
+        """Sends a batch of write operations in a single round trip.
+
+        The operations are unordered, so one failing does not stop the rest.
+
+        Args:
+            collection: The collection to write to.
+            operations: The PyMongo write operations to perform.
+        """
+        return Database.DB[collection].bulk_write(operations, ordered=False)
+
+    @staticmethod
+    def create_indexes(collection: str, indexes: List[Dict]) -> List[str]:
+        """Creates indexes on a collection unless they already exist.
+
+        Args:
+            collection: The collection to index.
+            indexes: Index specifications, each holding the 'keys' to index
+                and any IndexModel options such as 'unique'.
+
+        Returns:
+            The names of the indexes.
+        """
+        return Database.DB[collection].create_indexes(
+            [IndexModel(**index) for index in indexes])
+
+    @staticmethod
+    def drop_index(collection: str, name: str) -> None:
+        """Drops an index from a collection, if it exists.
+
+        Args:
+            collection: The indexed collection.
+            name: The name of the index.
+        """
+        if name in Database.DB[collection].index_information():
+            Database.DB[collection].drop_index(name)
+
+    @staticmethod
+    def explain(collection: str, query: dict) -> dict:
+        """Describes how the database would execute a query.
+
+        Args:
+            collection: The collection to query.
+            query: The search parameters.
+
+        Returns:
+            The query plan reported by the server.
+        """
+        return Database.DB[collection].find(query).explain()
+
     @staticmethod
     def delete_all(collection: str) -> DeleteResult:
         """Deletes all documents from a collection in the database.
@@ -86,7 +184,7 @@ class Database(object):
             collection: The collection to delete from.
             query: Parameters defining the document to be deleted.
         """
-        return Database.DB[collection].delete(query)
+        return Database.DB[collection].delete_one(query)
 
     @staticmethod
     def update_one(collection: str, query: dict, document: dict) -> UpdateResult:
@@ -101,4 +199,104 @@ class Database(object):
             document: The document to be upserted.
         """
         return Database.DB[collection].update_one(query, {'$set': document},
-                                                  upsert=True)
\ No newline at end of file
+                                                  upsert=True)
+
+
+class BulkWriter(object):
+    """A unit of work which collects upserts and writes them in batches.
+
+    BulkWriter has the same update_one interface as Database, so it can be
+    passed to Model.save_to_db in its place. Repeated updates to the same
+    document are merged. Other write operations can be queued with append.
+    Pending writes are flushed whenever batch_size of them are waiting and
+    when the writer is used as a context manager and exits. Functions
+    registered with after_flush run once the writes queued before them have
+    been written.
+
+    Attributes:
+        batch_size: The number of pending documents which triggers a flush.
+    """
+
+    def __init__(self, batch_size: int = 1000) -> None:
+        self.batch_size = batch_size
+        self._pending: Dict[str, Dict[str, Tuple[dict, dict]]] = {}
+        self._operations: Dict[str, List] = {}
+        self._callbacks: List[Callable[[], None]] = []
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "BulkWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.flush()
+
+    def update_one(self, collection: str, query: dict, document: dict) -> None:
+        """Queues an upsert of a document.
+
+        Args:
+            collection: The collection containing the document to be updated.
+            query: Parameters defining the document to be updated.
+            document: The document to be upserted.
+        """
+        key = repr(sorted(query.items()))
+
+        with self._lock:
+            pending = self._pending.setdefault(collection, {})
+            if key in pending:
+                pending[key][1].update(document)
+            else:
+                pending[key] = (query, dict(document))
+                self._count += 1
+            full = self._count >= self.batch_size
+
+        if full:
+            self.flush()
+
+    def append(self, collection: str, operation) -> None:
+        """Queues a write operation as it is.
+
+        Args:
+            collection: The collection to write to.
+            operation: A PyMongo write operation, such as UpdateOne.
+        """
+        with self._lock:
+            self._operations.setdefault(collection, []).append(operation)
+            self._count += 1
+            full = self._count >= self.batch_size
+
+        if full:
+            self.flush()
+
+    def after_flush(self, callback: Callable[[], None]) -> None:
+        """Calls a function once the writes queued so far have been written.
+
+        A function registered again before the next flush is called once.
+
+        Args:
+            callback: The function to call, without arguments.
+        """
+        with self._lock:
+            if callback not in self._callbacks:
+                self._callbacks.append(callback)
+
+    def flush(self) -> List[BulkWriteResult]:
+        """Writes every pending operation, one bulk write per collection."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            operations, self._operations = self._operations, {}
+            callbacks, self._callbacks = self._callbacks, []
+            self._count = 0
+
+        for collection, updates in pending.items():
+            operations.setdefault(collection, []).extend(
+                UpdateOne(query, {'$set': document}, upsert=True)
+                for query, document in updates.values())
+
+        results = [Database.bulk_write(collection, collection_operations)
+                   for collection, collection_operations in operations.items()]
+
+        for callback in callbacks:
+            callback()
+
+        return results
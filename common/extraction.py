@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+
+"""Targeted extraction of prices from streamed web pages."""
+
+import codecs
+import json
+import re
+
+from bs4 import BeautifulSoup, SoupStrainer
+from html.parser import HTMLParser
+from requests import Response
+from typing import Any, Dict, List, NamedTuple, Pattern
+
+from common.sessions import FetchError
+
+
+class Extraction(NamedTuple):
+    """The text holding a price and the way it was found.
+
+    Attributes:
+        text: The text containing the price.
+        source: 'json-ld' or 'open-graph' for structured data found while
+            streaming, 'selector' for the store's price element found while
+            streaming, 'full-parse' for the element found by BeautifulSoup
+            after streaming failed, or 'microdata' for an itemprop="price"
+            tag used when the store's element was not found at all.
+    """
+
+    text: str
+    source: str
+
+
+class ElementTextParser(HTMLParser):
+    """An incremental parser which finds the text of a single element.
+
+    Only the first element with the given tag name and attributes is
+    collected; everything else is skipped as it streams past. Attributes
+    match as they do in BeautifulSoup.find: a value may be a string, a list
+    of acceptable strings, or True to only require that the attribute is
+    present, and a class matches any one of an element's classes.
+
+    Attributes:
+        text: The element's text, or None until its end tag has been read.
+    """
+
+    def __init__(self, tag_name: str, attributes: Dict) -> None:
+        super().__init__(convert_charrefs=True)
+        self.text = None
+        self._tag_name = tag_name.lower()
+        self._attributes = attributes or {}
+        self._depth = 0
+        self._chunks: List[str] = []
+
+    def handle_starttag(self, tag: str, attrs: List) -> None:
+        if self.text is not None or tag != self._tag_name:
+            return
+
+        if self._depth or self._matches(dict(attrs)):
+            self._depth += 1
+
+    def handle_endtag(self, tag: str) -> None:
+        if self._depth and tag == self._tag_name:
+            self._depth -= 1
+            if not self._depth:
+                self.text = ''.join(self._chunks)
+
+    def handle_data(self, data: str) -> None:
+        if self._depth:
+            self._chunks.append(data)
+
+    def _matches(self, attrs: Dict[str, str]) -> bool:
+        """Checks an element's attributes against the wanted attributes."""
+        for name, wanted in self._attributes.items():
+            value = attrs.get(name)
+
+            if value is None:
+                return False
+            if wanted is True:
+                continue
+
+            candidates = {value}
+            if name == 'class':
+                candidates.update(value.split())
+
+            wanted = [wanted] if isinstance(wanted, str) else wanted
+            if candidates.isdisjoint(wanted):
+                return False
+
+        return True
+
+
+class StructuredDataScanner(object):
+    """Scans raw page bytes for machine-readable prices.
+
+    Looks for the offer price of the page's Product in application/ld+json
+    scripts, ignoring related products listed alongside it, and for a
+    product:price:amount Open Graph tag, which always describes the page's
+    own product. Only bytes added since the previous scan, plus an overlap
+    for markup split across chunks, are searched each time. Tags marked
+    itemprop="price" may belong to any product on the page, such as one in
+    a carousel, so they are only searched by microdata, after the store's
+    own price element has not been found.
+
+    Prices must be written as schema.org requires, with digits and an
+    optional decimal point. Anything else, such as "1.299,00", is ignored
+    rather than guessed at.
+
+    Attributes:
+        OVERLAP: The number of bytes before the previous scan's end which are
+            searched again.
+    """
+
+    OVERLAP = 64 * 1024
+
+    JSON_LD = re.compile(
+        rb'<script[^>]*application/ld\+json[^>]*>(.*?)</script',
+        re.IGNORECASE | re.DOTALL)
+    OPEN_GRAPH_TAG = re.compile(
+        rb'<meta\b[^>]*product:price:amount[^>]*>', re.IGNORECASE)
+    MICRODATA_TAG = re.compile(
+        rb'<[a-z]+\b[^>]*itemprop\s*=\s*["\']?price["\'\s>][^>]*>',
+        re.IGNORECASE)
+    CONTENT = re.compile(
+        rb'\bcontent\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]*))',
+        re.IGNORECASE)
+    NUMBER = re.compile(r'\d+(?:\.\d+)?')
+
+    def __init__(self) -> None:
+        self._scanned = 0
+
+    def scan(self, body: bytes) -> Extraction:
+        """Searches the page read so far for a structured price.
+
+        Args:
+            body: Every byte of the page read so far.
+
+        Returns:
+            The price as text with two decimal places, or None if not found.
+        """
+        start = max(0, self._scanned - self.OVERLAP)
+        self._scanned = len(body)
+
+        for match in self.JSON_LD.finditer(body, start):
+            price = self._json_ld_price(match.group(1))
+            if price is not None:
+                return Extraction(f'{price:.2f}', 'json-ld')
+
+        return self._tag_price(self.OPEN_GRAPH_TAG, body, start, 'open-graph')
+
+    def microdata(self, body: bytes) -> Extraction:
+        """Searches a whole page for an itemprop="price" tag.
+
+        Args:
+            body: The bytes of the page.
+
+        Returns:
+            The price as text with two decimal places, or None if not found.
+        """
+        return self._tag_price(self.MICRODATA_TAG, body, 0, 'microdata')
+
+    @classmethod
+    def _tag_price(cls, pattern: Pattern, body: bytes, start: int,
+                   source: str) -> Extraction:
+        """Finds the first tag matching a pattern whose content is a price."""
+        for match in pattern.finditer(body, start):
+            content = cls.CONTENT.search(match.group(0))
+            if content is not None:
+                value = next(group for group in content.groups()
+                             if group is not None)
+                price = cls._number(value.decode('ascii', errors='replace'))
+                if price is not None:
+                    return Extraction(f'{price:.2f}', source)
+
+        return None
+
+    @classmethod
+    def _json_ld_price(cls, script: bytes) -> float:
+        """Finds the offer price of the page's product in a JSON-LD script."""
+        try:
+            data = json.loads(script.decode('utf-8', errors='replace'))
+        except ValueError:
+            return None
+
+        product = cls._find_product(data)
+        if product is None:
+            return None
+
+        return cls._offer_price(product.get('offers'))
+
+    @classmethod
+    def _find_product(cls, data: Any) -> Dict:
+        """Finds the first top-level Product node of decoded JSON-LD.
+
+        Top-level nodes are the script's object, the items of its array or
+        @graph, and the mainEntity of any of them. Products nested deeper,
+        such as isRelatedTo, isSimilarTo or ItemList entries, describe other
+        items and are skipped.
+        """
+        if isinstance(data, dict) and '@graph' in data:
+            data = data['@graph']
+        nodes = data if isinstance(data, list) else [data]
+        nodes = [node for node in nodes if isinstance(node, dict)]
+        nodes += [node['mainEntity'] for node in nodes
+                  if isinstance(node.get('mainEntity'), dict)]
+
+        for node in nodes:
+            types = node.get('@type')
+            if not isinstance(types, list):
+                types = [types]
+            if 'Product' in types:
+                return node
+
+        return None
+
+    @classmethod
+    def _offer_price(cls, offers: Any) -> float:
+        """Finds the first price in a product's offers.
+
+        Offers may be a single Offer, a list of them, or an AggregateOffer,
+        whose lowPrice is used. A price may also be given in the offer's
+        priceSpecification.
+        """
+        if isinstance(offers, list):
+            for offer in offers:
+                price = cls._offer_price(offer)
+                if price is not None:
+                    return price
+
+        elif isinstance(offers, dict):
+            for key in ('price', 'lowPrice'):
+                if key in offers:
+                    price = cls._number(offers[key])
+                    if price is not None:
+                        return price
+
+            for key in ('priceSpecification', 'offers'):
+                price = cls._offer_price(offers.get(key))
+                if price is not None:
+                    return price
+
+        return None
+
+    @classmethod
+    def _number(cls, value: Any) -> float:
+        """Reads a price from a JSON-LD or content attribute value.
+
+        Only JSON numbers and strings of digits with an optional decimal
+        point are prices. Commas are ambiguous, as "12,99" may be twelve or
+        twelve hundred, so values holding them are rejected.
+        """
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, str) and cls.NUMBER.fullmatch(value.strip()):
+            return float(value)
+
+        return None
+
+
+class Extractor(object):
+    """Extracts a price from a streamed response.
+
+    Attributes:
+        CHUNK_SIZE: The number of bytes read from the response at a time.
+        MAX_BYTES: The most bytes read from any one page.
+    """
+
+    CHUNK_SIZE = 16 * 1024
+    MAX_BYTES = 2 * 1024 * 1024
+
+    @classmethod
+    def extract(cls, response: Response, tag_name: str,
+                attributes: Dict) -> Extraction:
+        """Reads a page until its price has been found.
+
+        Each chunk is first scanned for structured price data, then fed to an
+        incremental parser looking for the store's price element. Reading
+        stops as soon as either succeeds, or once MAX_BYTES have been read.
+        If neither finds a price, the bytes read are parsed again with
+        BeautifulSoup, restricted to the store's price element, and failing
+        that are searched for microdata. Markup the incremental parser
+        rejects only stops that parser; markup BeautifulSoup rejects too is
+        a FetchError unless microdata holds the price.
+
+        Args:
+            response: A streamed response whose body has not been read.
+            tag_name: The HTML tag enclosing the price.
+            attributes: The attributes of the HTML tag enclosing the price.
+
+        Returns:
+            The text holding the price, or None if it was not found.
+
+        Raises:
+            FetchError: If the page could not be parsed.
+        """
+        scanner = StructuredDataScanner()
+        parser = ElementTextParser(tag_name, attributes)
+        decoder = codecs.getincrementaldecoder(cls._encoding(response))(
+            errors='replace')
+        body = bytearray()
+
+        for chunk in response.iter_content(cls.CHUNK_SIZE):
+            body.extend(chunk)
+
+            extraction = scanner.scan(body)
+            if extraction is not None:
+                return extraction
+
+            if parser is not None:
+                try:
+                    parser.feed(decoder.decode(chunk))
+                except Exception:
+                    # html.parser raises assertions on some malformed
+                    # markup. The rest of the page is still scanned for
+                    # structured data.
+                    parser = None
+                else:
+                    if parser.text is not None:
+                        return Extraction(parser.text, 'selector')
+
+            if len(body) >= cls.MAX_BYTES:
+                break
+
+        strainer = SoupStrainer(tag_name, attributes)
+        try:
+            soup = BeautifulSoup(bytes(body), 'html.parser',
+                                 parse_only=strainer)
+        except Exception as e:
+            element, error = None, e
+        else:
+            element, error = soup.find(tag_name, attributes), None
+
+        if element is not None:
+            return Extraction(element.text, 'full-parse')
+
+        extraction = scanner.microdata(bytes(body))
+        if extraction is None and error is not None:
+            raise FetchError(f'Failed to parse {response.url}: {error}')
+
+        return extraction
+
+    @staticmethod
+    def _encoding(response: Response) -> str:
+        """Gets the page's declared encoding, assuming UTF-8 if there is none."""
+        content_type = response.headers.get('content-type', '')
+        encoding = response.encoding if 'charset' in content_type else None
+
+        try:
+            return codecs.lookup(encoding or 'utf-8').name
+        except LookupError:
+            return 'utf-8'
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+"""Concurrent price fetching."""
+
+import os
+
+from concurrent.futures import (FIRST_COMPLETED, Future, ThreadPoolExecutor,
+                                as_completed, wait)
+from typing import Callable, Dict, Iterable, Iterator, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+class Fetcher(object):
+    """Runs blocking fetches concurrently on a bounded thread pool.
+
+    Attributes:
+        max_workers: The global limit on fetches running at the same time.
+    """
+
+    def __init__(self, max_workers: int = None) -> None:
+        self.max_workers = max_workers or int(
+            os.environ.get('FETCH_CONCURRENCY', 16))
+
+    def run(self, task: Callable[[T], object],
+            objects: Iterable[T]) -> Iterator[Tuple[T, Future]]:
+        """Applies a task to each object concurrently.
+
+        No more than twice max_workers tasks are queued at any time, so the
+        objects may be supplied by a lazy iterator.
+
+        Args:
+            task: The blocking callable to apply to each object.
+            objects: The objects to process.
+
+        Yields:
+            (object, future) pairs in the order the tasks complete. Calling
+            future.result() returns the task's result or re-raises its error.
+        """
+        pending: Dict[Future, T] = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for obj in objects:
+                if len(pending) >= 2 * self.max_workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future
+
+                pending[executor.submit(task, obj)] = obj
+
+            for future in as_completed(pending):
+                yield pending[future], future
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+"""A background job queue stored in MongoDB."""
+
+import traceback
+import uuid
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from common.database import Database
+
+
+class Job(NamedTuple):
+    """A claimed job.
+
+    Attributes:
+        id: The unique identifier of the job.
+        name: The name of the handler which runs the job.
+        payload: The keyword arguments passed to the handler.
+        attempts: The number of times the job has been claimed, this time
+            included.
+    """
+
+    id: str
+    name: str
+    payload: Dict[str, Any]
+    attempts: int
+
+
+class JobQueue(object):
+    """Runs work outside the web request which asked for it.
+
+    Web handlers enqueue jobs, and the alert updater daemon claims and runs
+    them. A claimed job is leased to its worker, so a job whose worker died
+    is claimed again once the lease lapses. Jobs which raise are retried
+    with exponential backoff until MAX_ATTEMPTS, then kept as failed for a
+    week. Jobs which succeed are deleted.
+
+    Attributes:
+        COLLECTION: The collection holding the jobs.
+        INDEXES: Index specifications for the collection.
+        LEASE_SECONDS: How long a worker may run a job before it is retried.
+        MAX_ATTEMPTS: The number of times a job is tried before it fails.
+        BACKOFF: The seconds before a job's first retry, doubled each time.
+        FAILED_TTL: The seconds failed jobs are kept for.
+    """
+
+    COLLECTION = 'jobs'
+    LEASE_SECONDS = 5 * 60
+    MAX_ATTEMPTS = 5
+    BACKOFF = 30.0
+    FAILED_TTL = 7 * 24 * 60 * 60
+    INDEXES = [
+        {'keys': [('status', 1), ('run_at', 1)]},
+        {'keys': 'finished_at', 'expireAfterSeconds': FAILED_TTL},
+    ]
+
+    _handlers: Dict[str, Callable[..., Any]] = {}
+
+    @classmethod
+    def ensure_indexes(cls) -> None:
+        """Creates the job queue indexes unless they already exist."""
+        Database.create_indexes(cls.COLLECTION, cls.INDEXES)
+
+    @classmethod
+    def handler(cls, name: str) -> Callable:
+        """Registers a function as the handler of a kind of job.
+
+        Args:
+            name: The job name the function handles.
+        """
+        def register(function: Callable) -> Callable:
+            cls._handlers[name] = function
+            return function
+
+        return register
+
+    @classmethod
+    def enqueue(cls, name: str, **payload) -> str:
+        """Queues a job to run as soon as a worker is free.
+
+        Args:
+            name: The name of the job's handler.
+            payload: The keyword arguments to pass to the handler. They must
+                be storable in MongoDB.
+
+        Returns:
+            The unique identifier of the job.
+        """
+        job_id = uuid.uuid4().hex
+        Database.insert_one(cls.COLLECTION, {
+            '_id': job_id,
+            'name': name,
+            'payload': payload,
+            'status': 'queued',
+            'attempts': 0,
+            'run_at': datetime.now(timezone.utc),
+        })
+        return job_id
+
+    @classmethod
+    def claim(cls, worker: str) -> Optional[Job]:
+        """Claims the job which has been waiting longest.
+
+        Args:
+            worker: A name unique to the claiming worker.
+
+        Returns:
+            The claimed job, or None if no job is ready.
+        """
+        now = datetime.now(timezone.utc)
+        # A running job's run_at is the end of its lease.
+        query = {'status': {'$in': ['queued', 'running']},
+                 'run_at': {'$lte': now}}
+        update = {
+            '$set': {'status': 'running', 'worker': worker,
+                     'run_at': now + timedelta(seconds=cls.LEASE_SECONDS)},
+            '$inc': {'attempts': 1},
+        }
+
+        document = Database.find_one_and_update(
+            cls.COLLECTION, query, update, sort=[('run_at', 1)])
+        if document is None:
+            return None
+
+        return Job(document['_id'], document['name'], document['payload'],
+                   document['attempts'])
+
+    @classmethod
+    def run(cls, job: Job) -> bool:
+        """Runs a claimed job and records the outcome.
+
+        Returns:
+            Whether the job succeeded.
+        """
+        try:
+            cls._handlers[job.name](**job.payload)
+        except Exception as e:
+            cls._fail(job, e)
+            return False
+
+        Database.delete_one(cls.COLLECTION, {'_id': job.id})
+        return True
+
+    @classmethod
+    def _fail(cls, job: Job, error: Exception) -> None:
+        """Schedules a failed job's retry, or gives up on it."""
+        now = datetime.now(timezone.utc)
+        document = {'error': ''.join(traceback.format_exception_only(
+            type(error), error)).strip()}
+
+        if job.attempts < cls.MAX_ATTEMPTS:
+            document['status'] = 'queued'
+            document['run_at'] = now + timedelta(
+                seconds=cls.BACKOFF * 2 ** (job.attempts - 1))
+        else:
+            document['status'] = 'failed'
+            document['finished_at'] = now
+
+        Database.update_one(cls.COLLECTION, {'_id': job.id}, document)
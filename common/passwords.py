@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+"""Password hashing limited to a few hashes at a time across the server."""
+
+import fcntl
+import functools
+import os
+import stat
+import tempfile
+import time
+
+from contextlib import contextmanager
+from passlib.context import CryptContext
+from typing import Iterator, Optional, Tuple
+
+UNAVAILABLE = 'Logging in is unavailable right now. Please try again later.'
+
+
+class HasherBusyError(Exception):
+    """Raised when no hashing slot frees up in time."""
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+class PasswordHasher(object):
+    """Hashes and verifies passwords, a bounded number at a time.
+
+    PBKDF2 is deliberately slow, so a burst of logins hashing at once would
+    take every CPU from the other pages. Each hash first takes one of a
+    fixed number of slots, which are lock files shared by every web worker
+    process on the machine, so the limit is server-wide rather than per
+    worker. A request which cannot get a slot within WAIT seconds is turned
+    away instead of holding its web worker while it queues, as is one whose
+    lock file cannot be opened.
+
+    The lock files are kept in PASSWORD_LOCK_DIR, by default a directory in
+    the temporary directory named after the user the app runs as. The
+    directory is created private to that user, and used only if no other
+    user can write to it, so other users cannot hold the slots or plant
+    symlinks in place of the lock files.
+
+    Attributes:
+        ROUNDS: The PBKDF2 rounds of new hashes. Overridden by
+            PASSWORD_ROUNDS. Stored hashes with fewer rounds are rehashed on
+            the next successful login.
+        CONCURRENCY: The most hashes run at once on the server. Overridden
+            by PASSWORD_CONCURRENCY.
+        WAIT: The seconds a request waits for a slot. Overridden by
+            PASSWORD_WAIT.
+        POLL: The seconds between attempts to take a slot.
+    """
+
+    ROUNDS = 25000
+    CONCURRENCY = 1
+    WAIT = 5.0
+    POLL = 0.01
+
+    @classmethod
+    def hash(cls, password: str) -> str:
+        """Hashes a password for secure storage.
+
+        Raises:
+            HasherBusyError: If no slot was free in time, or the lock files
+                are unavailable.
+        """
+        with cls._slot():
+            return _context(cls._rounds()).hash(password)
+
+    @classmethod
+    def verify(cls, password: str, hash: str) -> Tuple[bool, Optional[str]]:
+        """Checks a plaintext password against a password hash.
+
+        Returns:
+            Whether the password matches, and a new hash to store if the
+            password matches but its hash uses outdated parameters.
+
+        Raises:
+            HasherBusyError: If no slot was free in time, or the lock files
+                are unavailable.
+        """
+        with cls._slot():
+            return _context(cls._rounds()).verify_and_update(password, hash)
+
+    @classmethod
+    def _rounds(cls) -> int:
+        """Gets the configured round count."""
+        return int(os.environ.get('PASSWORD_ROUNDS', cls.ROUNDS))
+
+    @classmethod
+    @contextmanager
+    def _slot(cls) -> Iterator[None]:
+        """Holds one of the server's hashing slots."""
+        concurrency = int(os.environ.get('PASSWORD_CONCURRENCY',
+                                         cls.CONCURRENCY))
+        deadline = time.monotonic() + float(os.environ.get('PASSWORD_WAIT',
+                                                           cls.WAIT))
+        directory = cls._lock_directory()
+
+        while True:
+            for slot in range(concurrency):
+                descriptor = cls._lock(os.path.join(
+                    directory, f'price-watcher-hash-{slot}.lock'))
+                if descriptor is None:
+                    continue
+
+                # The lock is released when its descriptor is closed, even
+                # if the process dies while hashing.
+                try:
+                    yield
+                finally:
+                    os.close(descriptor)
+                return
+
+            if time.monotonic() >= deadline:
+                raise HasherBusyError('Too many people are logging in right '
+                                      'now. Please try again in a moment.')
+            time.sleep(cls.POLL)
+
+    @staticmethod
+    def _lock_directory() -> str:
+        """Gets the directory of the lock files, creating it if needed.
+
+        Raises:
+            HasherBusyError: If the directory cannot be created, or another
+                user can write to it.
+        """
+        directory = os.environ.get('PASSWORD_LOCK_DIR') or os.path.join(
+            tempfile.gettempdir(), f'price-watcher-{os.getuid()}')
+
+        try:
+            try:
+                os.mkdir(directory, 0o700)
+            except FileExistsError:
+                pass
+
+            status = os.lstat(directory)
+            if not stat.S_ISDIR(status.st_mode) or \
+                    status.st_uid != os.getuid() or status.st_mode & 0o022:
+                raise PermissionError(f'{directory} is not a directory which '
+                                      f'only this user can write to')
+        except OSError as e:
+            print(f'Password lock directory unavailable: {e}')
+            raise HasherBusyError(UNAVAILABLE)
+
+        return directory
+
+    @staticmethod
+    def _lock(path: str) -> Optional[int]:
+        """Opens and locks a lock file, unless another hash holds it.
+
+        Returns:
+            The descriptor holding the lock, or None if the lock is taken.
+
+        Raises:
+            HasherBusyError: If the lock file cannot be opened.
+        """
+        try:
+            descriptor = os.open(path,
+                                 os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        except OSError as e:
+            print(f'Password lock file unavailable: {e}')
+            raise HasherBusyError(UNAVAILABLE)
+
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(descriptor)
+            return None
+
+        return descriptor
+
+
+@functools.lru_cache(maxsize=None)
+def _context(rounds: int) -> CryptContext:
+    """Builds the hashing policy for a round count."""
+    return CryptContext(schemes=['pbkdf2_sha512'],
+                        pbkdf2_sha512__default_rounds=rounds,
+                        pbkdf2_sha512__min_rounds=rounds)
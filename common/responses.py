@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+"""Conditional JSON responses."""
+
+from flask import Response, current_app, jsonify, request
+from typing import Any, Callable
+
+
+def conditional_json(version: str, load: Callable[[], Any]) -> Response:
+    """Responds with JSON, or 304 Not Modified if the client's copy is current.
+
+    The version is sent as the ETag. When the request's If-None-Match holds
+    it, the data is never loaded, so polling unchanged resources costs only
+    the version lookup.
+
+    Args:
+        version: A fingerprint of the data, such as Model.page_version.
+        load: Called to produce the JSON-serializable data if it is needed.
+    """
+    if request.if_none_match.contains(version):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(load())
+
+    response.set_etag(version)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
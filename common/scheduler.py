@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""Adaptive price check scheduling."""
+
+from typing import Optional
+
+
+class AdaptiveSchedule(object):
+    """Chooses how long to wait before an item's price is checked again.
+
+    Items whose price keeps changing are checked more often and stable items
+    less often. An item whose price is close to an alert's threshold is
+    checked as often as allowed, and an item nobody is watching as rarely as
+    allowed.
+
+    Attributes:
+        MIN_INTERVAL: The shortest interval between checks, in seconds.
+        MAX_INTERVAL: The longest interval between checks, in seconds.
+        DEFAULT_INTERVAL: The interval used for an item's first checks.
+        SPEED_UP: The factor applied to the interval when the price changed.
+        BACK_OFF: The factor applied to the interval when it did not.
+        NEAR_THRESHOLD: How close to a threshold, as a fraction of the
+            threshold, a price must be for the item to be checked as often as
+            possible.
+    """
+
+    MIN_INTERVAL = 15 * 60
+    MAX_INTERVAL = 24 * 60 * 60
+    DEFAULT_INTERVAL = 60 * 60
+    SPEED_UP = 0.5
+    BACK_OFF = 1.5
+    NEAR_THRESHOLD = 0.05
+
+    @classmethod
+    def next_interval(cls, interval: Optional[float], changed: bool,
+                      price: Optional[float],
+                      threshold: Optional[float]) -> float:
+        """Chooses the interval after a successful check.
+
+        Args:
+            interval: The item's current interval, or None if it has none.
+            changed: Whether the price changed at this check.
+            price: The price found.
+            threshold: The alert threshold closest to the price, or None if
+                no alert is watching the item.
+
+        Returns:
+            The number of seconds until the next check.
+        """
+        if threshold is None:
+            return cls.MAX_INTERVAL
+
+        if price is not None and \
+                abs(price - threshold) <= cls.NEAR_THRESHOLD * threshold:
+            return cls.MIN_INTERVAL
+
+        interval = interval or cls.DEFAULT_INTERVAL
+        interval *= cls.SPEED_UP if changed else cls.BACK_OFF
+
+        return cls._clamp(interval)
+
+    @classmethod
+    def failure_interval(cls, interval: Optional[float]) -> float:
+        """Chooses the interval after a failed check."""
+        return cls._clamp((interval or cls.DEFAULT_INTERVAL) * cls.BACK_OFF)
+
+    @classmethod
+    def _clamp(cls, interval: float) -> float:
+        """Keeps an interval within the allowed range."""
+        return max(cls.MIN_INTERVAL, min(cls.MAX_INTERVAL, interval))
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+
+"""Pooled, rate limited HTTP sessions for retail websites."""
+
+import os
+import random
+import threading
+import time
+
+import requests
+
+from contextlib import contextmanager
+from requests import Response
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterator
+from urllib3.util.request import ACCEPT_ENCODING
+
+from common.utils import Utils
+
+
+class FetchError(Exception):
+    """Raised when a page cannot be fetched or a price cannot be found."""
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+class CircuitOpenError(FetchError):
+    """Raised when a store is being skipped after repeated failures."""
+    pass
+
+
+class CircuitBreaker(object):
+    """Stops requests to a failing store for a cooldown window.
+
+    The breaker opens after a number of consecutive failures. Once the
+    cooldown has passed, requests are let through again, but a single further
+    failure re-opens it.
+
+    Attributes:
+        threshold: The number of consecutive failures which opens the breaker.
+        cooldown: The number of seconds the breaker stays open.
+    """
+
+    def __init__(self, threshold: int, cooldown: float) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Checks whether a request may be sent."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+
+            if time.monotonic() - self._opened_at < self.cooldown:
+                return False
+
+            self._opened_at = None
+            self._failures = self.threshold - 1
+            return True
+
+    def record_success(self) -> None:
+        """Closes the breaker."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        """Counts a failure, opening the breaker at the threshold."""
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+
+class TokenBucket(object):
+    """A thread-safe token bucket rate limiter.
+
+    Attributes:
+        rate: The number of tokens added per second.
+        capacity: The maximum number of tokens held, i.e. the burst size.
+    """
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Takes a token from the bucket, waiting until one is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens +
+                                   (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                delay = (1 - self._tokens) / self.rate
+
+            time.sleep(delay)
+
+
+class StoreSession(object):
+    """A keep-alive session shared by every request to one store's domain.
+
+    Each updater process holds its own sessions, so a store's limits are
+    shared out between the UPDATER_WORKERS processes fetching from it: each
+    gets an equal share of the connections, request rate and burst, and at
+    least one connection and a burst of one. Run more workers than a
+    store's max_connections and the store sees one connection per worker.
+
+    Attributes:
+        MAX_CONNECTIONS: The default number of concurrent requests per store.
+        REQUESTS_PER_SECOND: The default sustained request rate per store.
+        BURST: The default number of requests allowed in a burst.
+        CONNECT_TIMEOUT: The default seconds allowed to establish a connection.
+        READ_TIMEOUT: The default seconds allowed between bytes of a response.
+        MAX_RETRIES: The default number of retries after a transient failure.
+        BACKOFF: The delay in seconds before the first retry, doubled for
+            each further retry.
+        FAILURE_THRESHOLD: The consecutive failed fetches which open the
+            store's circuit breaker.
+        COOLDOWN: The seconds a store is skipped once its breaker opens.
+        RETRY_STATUSES: HTTP statuses which are worth retrying.
+        DRAIN_BYTES: The most unread body bytes read and discarded to keep a
+            connection alive when a response is closed early.
+    """
+
+    MAX_CONNECTIONS = 4
+    REQUESTS_PER_SECOND = 2.0
+    BURST = 4
+    CONNECT_TIMEOUT = 5.0
+    READ_TIMEOUT = 15.0
+    MAX_RETRIES = 2
+    BACKOFF = 1.0
+    FAILURE_THRESHOLD = 5
+    COOLDOWN = 300.0
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    DRAIN_BYTES = 64 * 1024
+
+    def __init__(self, max_connections: int = MAX_CONNECTIONS,
+                 requests_per_second: float = REQUESTS_PER_SECOND,
+                 burst: int = BURST,
+                 connect_timeout: float = CONNECT_TIMEOUT,
+                 read_timeout: float = READ_TIMEOUT,
+                 max_retries: int = MAX_RETRIES) -> None:
+        self.limits = (max_connections, requests_per_second, burst,
+                       connect_timeout, read_timeout, max_retries)
+
+        workers = self.worker_count()
+        max_connections = max(1, max_connections // workers)
+        requests_per_second /= workers
+        burst = max(1, burst // workers)
+
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.breaker = CircuitBreaker(self.FAILURE_THRESHOLD, self.COOLDOWN)
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+
+        self.session = requests.Session()
+        # Ask for every compressed encoding urllib3 is able to decode, which
+        # includes brotli and zstd when their decoders are installed.
+        self.session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._bucket = TokenBucket(requests_per_second, burst)
+
+    @staticmethod
+    def worker_count() -> int:
+        """Gets the number of updater processes sharing each store's limits."""
+        return max(1, int(os.environ.get('UPDATER_WORKERS', 1)))
+
+    @contextmanager
+    def open(self, url: str, **kwargs) -> Iterator[Response]:
+        """Opens a streamed GET request once the store's limits allow it.
+
+        The body must be read inside the with block, which holds one of the
+        store's connection slots until it exits. Transient failures are
+        retried with exponential backoff until the retry budget is spent.
+        Every failed fetch counts towards opening the store's breaker,
+        including error responses which are not retried, such as a 403 from
+        a store blocking the updater.
+
+        Args:
+            url: The page to fetch.
+            **kwargs: Passed through to requests.Session.get.
+
+        Yields:
+            The HTTP response, with its body not yet read.
+
+        Raises:
+            CircuitOpenError: If the store is cooling down after failures.
+            FetchError: If the page could not be fetched.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f'Skipping {url}: the store is cooling '
+                                   f'down after repeated failures.')
+
+        kwargs.setdefault('timeout', self.timeout)
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.BACKOFF * 2 ** (attempt - 1) *
+                           random.uniform(0.5, 1.5))
+
+            self._slots.acquire()
+            try:
+                self._bucket.acquire()
+                response = self.session.get(url, stream=True, **kwargs)
+            except requests.RequestException as e:
+                self._slots.release()
+                error = f'Failed to fetch {url}: {e}'
+                continue
+
+            if response.status_code in self.RETRY_STATUSES:
+                self._close(response)
+                self._slots.release()
+                error = f'Failed to fetch {url}: HTTP {response.status_code}'
+                continue
+
+            try:
+                if response.status_code >= 400:
+                    self.breaker.record_failure()
+                    raise FetchError(f'Failed to fetch {url}: '
+                                     f'HTTP {response.status_code}')
+
+                self.breaker.record_success()
+                yield response
+            except requests.RequestException as e:
+                self.breaker.record_failure()
+                raise FetchError(f'Failed to read {url}: {e}')
+            finally:
+                self._close(response)
+                self._slots.release()
+
+            return
+
+        self.breaker.record_failure()
+        raise FetchError(error)
+
+    def _close(self, response: Response) -> None:
+        """Closes a response, returning its connection to the pool if cheap.
+
+        A connection can only be reused once its response body has been read
+        to the end; closing it earlier closes the socket, and the next
+        request to the store pays for a new TCP and TLS handshake. Prices
+        are usually found well before the end of a page, so a remaining
+        body of up to DRAIN_BYTES is read and discarded to keep the
+        connection. A larger rest, or one of unknown length, costs more to
+        download than a handshake, so that connection is closed.
+        """
+        try:
+            remaining = (int(response.headers['Content-Length']) -
+                         response.raw.tell())
+        except (KeyError, ValueError):
+            remaining = None
+
+        if remaining is not None and 0 < remaining <= self.DRAIN_BYTES:
+            response.raw.drain_conn()
+
+        response.close()
+
+
+class Sessions(object):
+    """A registry of sessions, one per store domain."""
+
+    _sessions: Dict[str, StoreSession] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, domain: str, session: StoreSession) -> None:
+        """Sets the session used for a store's domain.
+
+        A session already in use with the same limits is kept, along with its
+        open connections.
+
+        Args:
+            domain: The store's domain or any URL on it.
+            session: The session configured with the store's limits.
+        """
+        hostname = Utils.hostname(domain)
+        with cls._lock:
+            current = cls._sessions.get(hostname)
+            if current is None or current.limits != session.limits:
+                cls._sessions[hostname] = session
+
+    @classmethod
+    def for_url(cls, url: str) -> StoreSession:
+        """Gets the session for the domain hosting a URL.
+
+        Domains which have not been configured get a session with the
+        default limits.
+        """
+        hostname = Utils.hostname(url)
+        with cls._lock:
+            if hostname not in cls._sessions:
+                cls._sessions[hostname] = StoreSession()
+            return cls._sessions[hostname]
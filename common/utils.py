@@ -4,23 +4,77 @@
 
 import re
 
-from passlib.hash import pbkdf2_sha512
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from common.passwords import PasswordHasher
 
 
 class Utils(object):
-    """Common helper utilities."""
+    """Common helper utilities.
+
+    Attributes:
+        TRACKING_PARAMETERS: Query parameters which only identify where a
+            visitor came from, and are dropped from canonical URLs. Only
+            names no store uses for anything else belong here; a name like
+            tag or ref may select a product variant.
+        TRACKING_PREFIXES: Prefixes of further tracking parameters.
+    """
+
+    TRACKING_PARAMETERS = frozenset({
+        'fbclid', 'gclid', 'dclid', 'gbraid', 'wbraid', 'msclkid', 'yclid',
+        'igshid', 'mc_cid', 'mc_eid', '_ga', '_gl'})
+    TRACKING_PREFIXES = ('utm_', 'pd_rd_', 'pf_rd_')
+
     @staticmethod
     def validate_email(email: str) -> bool:
         """Check if an email address is valid."""
         r = re.compile(r'^[\w-]+@([\w-]+\.)+[\w]+$')
         return True if r.match(email) else False
 
+    @staticmethod
+    def hostname(url: str) -> str:
+        """Get the normalized hostname of a URL or bare domain."""
+        if '//' not in url:
+            url = '//' + url
+        hostname = (urlsplit(url).hostname or '').rstrip('.')
+        return hostname[4:] if hostname.startswith('www.') else hostname
+
+    @classmethod
+    def canonical_url(cls, url: str) -> str:
+        """Get the canonical form of a product URL, for comparing links.
+
+        The scheme and host are lowercased, a leading www. and default ports
+        are removed as in hostname, fragments and tracking parameters are
+        dropped and the remaining parameters are sorted, so that links to
+        the same product compare equal. The path is kept as it is. The
+        result identifies a product but is not meant to be fetched, since a
+        store may not serve it.
+        """
+        url = url.strip()
+        if '//' not in url:
+            url = 'http://' + url
+        parts = urlsplit(url)
+        scheme = (parts.scheme or 'http').lower()
+
+        host = cls.hostname(url)
+        if parts.port and (scheme, parts.port) not in (('http', 80),
+                                                       ('https', 443)):
+            host = f'{host}:{parts.port}'
+
+        query = urlencode(sorted(
+            (name, value)
+            for name, value in parse_qsl(parts.query, keep_blank_values=True)
+            if name.lower() not in cls.TRACKING_PARAMETERS and
+            not name.lower().startswith(cls.TRACKING_PREFIXES)))
+
+        return urlunsplit((scheme, host, parts.path or '/', query, ''))
+
     @staticmethod
     def hash_password(password: str) -> str:
         """Hash a password for secure storage."""
-        return pbkdf2_sha512.hash(password)
+        return PasswordHasher.hash(password)
 
     @staticmethod
     def verify_password(password: str, hash: str) -> bool:
         """Check a plaintext password against a password hash."""
-        return pbkdf2_sha512.verify(password, hash)
+        return PasswordHasher.verify(password, hash)[0]
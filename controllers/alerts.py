@@ -2,11 +2,15 @@
 
 """Web handler for alert related pages."""
 
-from flask import Blueprint, redirect, render_template, request, session, url_for
+from flask import (Blueprint, abort, redirect, render_template, request,
+                   session, url_for)
 
+from common.database import Database
+from common.jobs import JobQueue
+from common.responses import conditional_json
 from models.alert import Alert
 from models.item import Item
-from models.store import Store
+from models.store import Store, StoreError
 from models.user.decorators import requires_login
 
 alert_blueprint = Blueprint('alerts', __name__)
@@ -15,9 +19,12 @@ alert_blueprint = Blueprint('alerts', __name__)
 @alert_blueprint.route('/')
 @requires_login
 def index():
-    """Displays all saved alerts."""
-    alerts = Alert.find_many('user_email', session['email'])
-    return render_template('alerts/index.html', alerts=alerts)
+    """Displays a page of the user's saved alerts."""
+    page = Alert.page({'user_email': session['email']},
+                      request.args.get('after'),
+                      projection=['item_name', 'item_id', 'price_floor'])
+    return render_template('alerts/index.html', alerts=page.objects,
+                           next_after=page.next_after)
 
 
 @alert_blueprint.route('/new', methods=['GET', 'POST'])
@@ -29,14 +36,25 @@ def new():
         item_url = request.form['item-url']
         price_limit = float(request.form['price-limit'])
 
-        store = Store.find_by_url(item_url)
-        item = Item(item_url, store.html_tag_name, store.html_tag_attributes)
-        item.fetch_price()
-        item.save_to_db()
+        try:
+            store = Store.find_by_url(item_url)
+        except StoreError as e:
+            return e.message
+
+        item = Item.find_or_create(item_url, store.html_tag_name,
+                                   store.html_tag_attributes)
 
         alert = Alert(item_name, item._id, price_limit, session['email'])
         alert.save_to_db()
 
+        # The first price is fetched by the alert updater, so a slow store
+        # cannot hold up the response. An item other alerts already watch
+        # may not be due for hours, so it is checked at the next cycle.
+        if item.price is None:
+            JobQueue.enqueue('fetch_price', item_id=item._id)
+        else:
+            item.check_now()
+
         return redirect(url_for('.index'))
 
     return render_template('alerts/new.html')
@@ -50,6 +68,7 @@ def update(alert_id: str):
 
     if request.method == 'POST':
         alert.price_floor = float(request.form['price-limit'])
+        alert.armed = True
         alert.save_to_db()
         return redirect(url_for('.index'))
 
@@ -65,3 +84,42 @@ def delete(alert_id: str):
         alert.delete()
 
     return redirect(url_for('.index'))
+
+
+@alert_blueprint.route('/api/alerts')
+@requires_login
+def api_alerts():
+    """Lists a page of the user's alerts as JSON."""
+    query = {'user_email': session['email']}
+    after = request.args.get('after')
+
+    def load():
+        page = Alert.page(query, after)
+        return {'alerts': [alert.json() for alert in page.objects],
+                'next_after': page.next_after}
+
+    return conditional_json(Alert.page_version(query, after), load)
+
+
+@alert_blueprint.route('/api/items/<string:item_id>')
+@requires_login
+def api_item(item_id: str):
+    """Shows an item and its current price as JSON."""
+    version = Item.version(item_id)
+    if version is None:
+        abort(404)
+
+    def load():
+        # Read past the item cache, so the data is never older than the
+        # version it is sent with.
+        document = Database.find_one(Item._db_collection, {'_id': item_id})
+        if document is None:
+            abort(404)
+
+        item = Item.from_document(document)
+        return {'_id': item._id, 'url': item.url, 'price': item.price,
+                'price_source': item.price_source,
+                'last_checked': item.last_checked,
+                'last_error': item.last_error}
+
+    return conditional_json(version, load)
@@ -6,6 +6,8 @@ import json
 
 from flask import Blueprint, render_template, redirect, request, url_for
 
+from common.responses import conditional_json
+from common.sessions import StoreSession
 from models.store import Store
 from models.user.decorators import requires_admin, requires_login
 
@@ -15,9 +17,11 @@ store_blueprint = Blueprint('stores', __name__)
 @store_blueprint.route('/')
 @requires_login
 def index():
-    """Shows all saved stores."""
-    stores = Store.fetch_all()
-    return render_template('stores/index.html', stores=stores)
+    """Shows a page of the saved stores."""
+    page = Store.page(after=request.args.get('after'),
+                      projection=['name', 'domain'])
+    return render_template('stores/index.html', stores=page.objects,
+                           next_after=page.next_after)
 
 
 @store_blueprint.route('/new', methods=['GET', 'POST'])
@@ -29,12 +33,16 @@ def new():
         domain = request.form['store-domain']
         tag = request.form['item-tag']
         query = json.loads(request.form['item-query'])
+        max_connections = int(request.form['max-connections'])
+        requests_per_second = float(request.form['requests-per-second'])
+        burst = int(request.form['burst'])
 
-        Store(name, domain, tag, query).save_to_db()
+        Store(name, domain, tag, query, max_connections, requests_per_second,
+              burst).save_to_db()
 
         return redirect(url_for('.index'))
 
-    return render_template('stores/new.html')
+    return render_template('stores/new.html', defaults=StoreSession)
 
 
 @store_blueprint.route('/edit/<string:store_id>', methods=['GET', 'POST'])
@@ -48,11 +56,17 @@ def update(store_id: str):
         domain = request.form['store-domain']
         tag = request.form['item-tag']
         query = json.loads(request.form['item-query'])
+        max_connections = int(request.form['max-connections'])
+        requests_per_second = float(request.form['requests-per-second'])
+        burst = int(request.form['burst'])
 
         store.name = name
         store.domain = domain
         store.html_tag_name = tag
         store.html_tag_attributes = query
+        store.max_connections = max_connections
+        store.requests_per_second = requests_per_second
+        store.burst = burst
 
         store.save_to_db()
 
@@ -67,3 +81,17 @@ def delete(store_id: str):
     """Deletes an existing store."""
     Store.fetch_by_id(store_id).delete()
     return redirect(url_for('.index'))
+
+
+@store_blueprint.route('/api/stores')
+@requires_login
+def api_stores():
+    """Lists a page of the saved stores as JSON."""
+    after = request.args.get('after')
+
+    def load():
+        page = Store.page(after=after)
+        return {'stores': [store.json() for store in page.objects],
+                'next_after': page.next_after}
+
+    return conditional_json(Store.page_version(after=after), load)
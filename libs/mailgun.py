@@ -2,45 +2,75 @@
 
 """Library for interacting with the Mailgun service."""
 
+import json
 import os
+import threading
 
-from requests import post, Response
-from typing import List
+import requests
+
+from requests import Response
+from requests.adapters import HTTPAdapter
+from typing import Dict, List
 
 
 class MailgunException(Exception):
     """Mailgun exception handler."""
-    message: str
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return self.message
 
 
 class Mailgun(object):
     """Class for interacting with MailGun service.
 
+    Requests share one pooled session. The API is read from MAILGUN_API_URL
+    when set, so a local stand-in server can be used for testing.
+
     Attributes:
         FROM_NAME: The sender's name.
         FROM_EMAIL: The sender's email address.
+        API_URL: The Mailgun API base URL.
+        MAX_RECIPIENTS: The most recipients Mailgun accepts in one message.
+        TIMEOUT: The connect and read timeouts of API requests, in seconds.
     """
 
     FROM_NAME = 'Pricing Service'
     FROM_EMAIL = 'do-not-reply@sandboxf4a23711dba74ab69c683dd67a53db67.mailgun.org'
+    API_URL = 'https://api.mailgun.net/v3'
+    MAX_RECIPIENTS = 1000
+    TIMEOUT = (5.0, 30.0)
+
+    _session: requests.Session = None
+    _lock = threading.Lock()
 
     @classmethod
     def send_mail(cls, recipients: List[str], subject: str,
-                  body_text: str, body_html: str) -> Response:
+                  body_text: str, body_html: str,
+                  recipient_variables: Dict[str, Dict] = None) -> Response:
         """Sends an email.
 
+        With recipient variables, each recipient receives their own copy of
+        the email, in which %recipient.<name>% placeholders are replaced by
+        their variables.
+
         Args:
             recipients: A list of email addresses to send to.
             subject: The email subject.
             body_text: The plaintext email body.
             body_html: The HTML email body.
+            recipient_variables: The variables of each recipient, by email
+                address.
 
         Returns:
             The HTTP response from Mailgun.
 
         Raises:
-            MailgunException: If no api_key or domain has been set, or if the
-                HTTP response is anything other than '200 OK'
+            MailgunException: If no api_key or domain has been set, if there
+                are more than MAX_RECIPIENTS recipients, if Mailgun cannot be
+                reached, or if the HTTP response is anything other than
+                '200 OK'
 
         """
         api_key = os.environ.get('MAILGUN_API_KEY', None)
@@ -49,17 +79,40 @@ class Mailgun(object):
 
         domain = os.environ.get('MAILGUN_DOMAIN', None)
         if domain is None:
-            raise MailgunException('Failed to load Mailgun API key.')
-
-        response = post(f'{cls.MAILGUN_DOMAIN}/messages',
-                        auth=('api', cls.MAILGUN_API_KEY),
-                        data={'from': f'{cls.FROM_NAME} <{cls.FROM_EMAIL}>',
-                              'to': recipients,
-                              'subject': subject,
-                              'text': body_text,
-                              'html': body_html})
+            raise MailgunException('Failed to load Mailgun domain.')
+
+        if len(recipients) > cls.MAX_RECIPIENTS:
+            raise MailgunException(f'Mailgun accepts at most '
+                                   f'{cls.MAX_RECIPIENTS} recipients.')
+
+        api_url = os.environ.get('MAILGUN_API_URL', cls.API_URL).rstrip('/')
+        data = {'from': f'{cls.FROM_NAME} <{cls.FROM_EMAIL}>',
+                'to': recipients,
+                'subject': subject,
+                'text': body_text,
+                'html': body_html}
+        if recipient_variables is not None:
+            data['recipient-variables'] = json.dumps(recipient_variables)
+
+        try:
+            response = cls._get_session().post(f'{api_url}/{domain}/messages',
+                                               auth=('api', api_key),
+                                               data=data, timeout=cls.TIMEOUT)
+        except requests.RequestException as e:
+            raise MailgunException(f'Failed to reach Mailgun: {e}')
 
         if response.status_code != 200:
-            raise MailgunException('An error occurred while sending email.')
+            raise MailgunException(f'An error occurred while sending email: '
+                                   f'HTTP {response.status_code}')
 
         return response
+
+    @classmethod
+    def _get_session(cls) -> requests.Session:
+        """Gets the shared session, creating it on first use."""
+        with cls._lock:
+            if cls._session is None:
+                cls._session = requests.Session()
+                cls._session.mount('https://', HTTPAdapter(pool_maxsize=4))
+                cls._session.mount('http://', HTTPAdapter(pool_maxsize=4))
+            return cls._session
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""Merge items which link to the same product.
+
+Items used to be created per alert, so one product could be stored many
+times. This groups the items by canonical URL, keeps one item per product,
+moves the alerts of the others onto it, and deletes the rest. Each kept
+item is given its canonical URL, which is then indexed as unique, replacing
+the old URL index. Run it before starting the app after upgrading, and again
+whenever the rules of Utils.canonical_url change.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timezone
+from pymongo.operations import DeleteOne, UpdateMany, UpdateOne
+
+from common.database import Database
+from common.utils import Utils
+from models.alert import Alert
+from models.item import Item
+
+if __name__ == '__main__':
+    products = defaultdict(list)
+    for document in Database.find_many(Item._db_collection, {},
+                                       ['url', 'canonical_url',
+                                        'last_checked']):
+        products[Utils.canonical_url(document['url'])].append(document)
+
+    alert_operations = []
+    deletions = []
+    keys = []
+    now = datetime.now(timezone.utc)
+
+    # Every rewritten document gets a new updated_at, so clients holding
+    # its old version fetch it again.
+    for url, documents in products.items():
+        # Keep the most recently checked item, whose price is freshest.
+        documents.sort(key=lambda document: document.get('last_checked') or
+                       datetime.min, reverse=True)
+        kept, duplicates = documents[0], documents[1:]
+
+        if kept.get('canonical_url') != url:
+            keys.append(UpdateOne({'_id': kept['_id']},
+                                  {'$set': {'canonical_url': url,
+                                            'updated_at': now}}))
+
+        for duplicate in duplicates:
+            alert_operations.append(UpdateMany(
+                {'item_id': duplicate['_id']},
+                {'$set': {'item_id': kept['_id'], 'updated_at': now}}))
+            deletions.append(DeleteOne({'_id': duplicate['_id']}))
+
+    # The unique index is rebuilt once every item has its new key, since
+    # under changed rules a kept item may take a key another item holds.
+    Database.drop_index(Item._db_collection, 'canonical_url_1')
+
+    for collection, operations in ((Alert._db_collection, alert_operations),
+                                   (Item._db_collection, deletions),
+                                   (Item._db_collection, keys)):
+        if operations:
+            Database.bulk_write(collection, operations)
+
+    Item.ensure_indexes()
+
+    merged = sum(len(documents) - 1 for documents in products.values())
+    print(f'Merged {merged} duplicate items into {len(products)} products.')
@@ -2,14 +2,18 @@
 
 """Alert management."""
 
+import os
 import uuid
 
 from dataclasses import dataclass,  field
-from typing import Dict
+from datetime import datetime, timedelta, timezone
+from typing import ClassVar, Dict, Iterable, List, Optional, Set
 
-from libs.mailgun import Mailgun
+from common.database import BulkWriter, Database
 from models.item import Item
 from models.model import Model
+from models.notification import Notification
+from models.relation import Relation
 from models.user.user import User
 
 
@@ -22,36 +26,212 @@ class Alert(Model):
         item_id: The unique identifier of the item.
         price_floor: The price threshold, below which the alert triggers.
         user_email: The email address of the user to whom this alert belongs.
+        armed: Whether the next crossing of the price floor notifies the user.
+            Disarmed once the user is notified, and re-armed once the price
+            rises back above the floor by REARM_MARGIN.
+        last_notified_price: The price the user was last notified of.
+        last_notified_at: When the user was last notified.
+        item: The item being watched, loaded on first access.
+        user: The user who owns the alert, loaded on first access.
+        DROP_DELTA: How far, as a fraction, the price must drop below the
+            last notified price to notify a disarmed alert again. Overridden
+            by ALERT_DROP_DELTA.
+        COOLDOWN: The seconds after which a disarmed alert still below its
+            floor notifies again, or 0 to never remind. Overridden by
+            ALERT_COOLDOWN.
+        REARM_MARGIN: How far, as a fraction of the floor, the price must
+            rise above the floor to re-arm the alert, so that a price
+            hovering around the floor does not notify at every crossing.
     """
 
+    DROP_DELTA = 0.05
+    COOLDOWN = 7 * 24 * 60 * 60
+    REARM_MARGIN = 0.01
+
     item_name: str
     item_id: str
     price_floor: float
     user_email: str
+    armed: bool = field(default=True)
+    last_notified_price: float = field(default=None)
+    last_notified_at: datetime = field(default=None)
     _db_collection: str = field(init=False, default='alerts')
+    _indexes: ClassVar[List[Dict]] = [
+        {'keys': [('user_email', 1), ('_id', 1)]},
+        {'keys': [('item_id', 1), ('price_floor', 1)]},
+        {'keys': [('item_id', 1), ('price_floor', 1)],
+         'name': 'item_id_1_price_floor_1_disarmed',
+         'partialFilterExpression': {'armed': False}},
+    ]
+    _dropped_indexes: ClassVar[List[str]] = ['user_email_1', 'item_id_1']
     _id: str = field(default_factory=lambda: uuid.uuid4().hex)
 
-    def __post_init__(self) -> None:
-        self.item = Item.fetch_by_id(self.item_id)
-        self.user = User.find_by_email(self.user_email)
+    item = Relation(Item, 'item_id')
+    user = Relation(User, 'user_email', 'email')
+
+    @classmethod
+    def hydrate(cls, documents: Iterable[Dict],
+                partial: bool = False) -> List["Alert"]:
+        """Builds alerts, loading all of their items in a single query.
+
+        Users are only loaded when first accessed. Alerts which share an item
+        share the same Item object.
+        """
+        alerts = super().hydrate(documents, partial)
+        cls.item.prefetch(alerts)
+        return alerts
+
+    @classmethod
+    def watched(cls, item_ids: Iterable[str]) -> Set[str]:
+        """Finds which of a set of items any alert is watching.
+
+        Only the (item_id, price_floor) index is read, however many alerts
+        watch each item.
+        """
+        return set(Database.distinct(cls._db_collection, 'item_id',
+                                     {'item_id': {'$in': list(item_ids)}}))
+
+    @classmethod
+    def triggered(cls, item: Item) -> List["Alert"]:
+        """Fetches the alerts whose floor is above an item's price.
+
+        The query reads only those alerts' entries in the (item_id,
+        price_floor) index, so its cost depends on how many alerts the price
+        triggers rather than how many watch the item.
+
+        Returns:
+            The alerts, lowest floor first, with the item attached.
+        """
+        return cls._find_for_item(item, {'price_floor': {'$gt': item.price}},
+                                  [('price_floor', 1)])
+
+    @classmethod
+    def rearmed(cls, item: Item) -> List["Alert"]:
+        """Fetches the disarmed alerts an item's price has risen clear of.
+
+        A disarmed alert is re-armed once the price is REARM_MARGIN above its
+        floor. The query is served by a partial index holding only the
+        disarmed alerts, which are few, since alerts re-arm once the price
+        recovers.
+
+        Returns:
+            The alerts, with the item attached.
+        """
+        highest = item.price / (1 + cls.REARM_MARGIN)
+        return cls._find_for_item(item, {'armed': False,
+                                         'price_floor': {'$lte': highest}})
+
+    @classmethod
+    def floor_below(cls, item_id: str, price: float) -> Optional[float]:
+        """Finds the highest price floor on an item at or below a price.
+
+        Returns:
+            The floor, or None if no alert on the item has one.
+        """
+        documents = Database.find_many(
+            cls._db_collection,
+            {'item_id': item_id, 'price_floor': {'$lte': price}},
+            {'_id': False, 'price_floor': True},
+            sort=[('price_floor', -1)]).limit(1)
+        return next((document['price_floor'] for document in documents), None)
+
+    @classmethod
+    def _find_for_item(cls, item: Item, query: Dict,
+                       sort: List = None) -> List["Alert"]:
+        """Fetches alerts on an item, attaching it rather than loading it."""
+        documents = Database.find_many(cls._db_collection,
+                                       {'item_id': item._id, **query},
+                                       sort=sort)
+
+        alerts = [cls.from_document(document) for document in documents]
+        for alert in alerts:
+            alert.item = item
+
+        return alerts
+
+    def price_reached(self, writer: BulkWriter = None) -> bool:
+        """Handles a price below the floor, notifying only if it is news.
+
+        The user is notified when the price first crosses the floor, when it
+        drops a further DROP_DELTA below the price they were last notified
+        of, or as a reminder once COOLDOWN has passed. Otherwise nothing is
+        sent or written.
+
+        Args:
+            writer: A bulk writer to queue the notification and the alert's
+                new state on.
+
+        Returns:
+            Whether a notification was queued.
+        """
+        price = self.item.price
+        now = datetime.now(timezone.utc)
+
+        if not self.armed and not self._dropped_further(price) and \
+                not self._cooled_down(now):
+            return False
+
+        self.armed = False
+        self.last_notified_price = price
+        self.last_notified_at = now
+        self._save_state(writer)
+        self.notify(writer)
+
+        return True
+
+    def rearm(self, writer: BulkWriter = None) -> None:
+        """Re-arms the alert after the price has risen back above the floor."""
+        self.armed = True
+        self._save_state(writer)
+
+    def notify(self, writer: BulkWriter = None) -> None:
+        """Queues a notification that the target price has been reached.
+
+        The notification is sent later from the outbox; see Notification.
+
+        Args:
+            writer: A bulk writer to queue the notification's save on.
+        """
+        Notification(self._id, self.user_email, self.item_name,
+                     self.item.url, self.item.price,
+                     self.price_floor).save_to_db(writer)
+
+    def _dropped_further(self, price: float) -> bool:
+        """Checks whether the price dropped well below the last notified."""
+        if self.last_notified_price is None:
+            return True
+
+        delta = float(os.environ.get('ALERT_DROP_DELTA', self.DROP_DELTA))
+        return price <= self.last_notified_price * (1 - delta)
+
+    def _cooled_down(self, now: datetime) -> bool:
+        """Checks whether enough time has passed to remind the user."""
+        cooldown = float(os.environ.get('ALERT_COOLDOWN', self.COOLDOWN))
+        if not cooldown or self.last_notified_at is None:
+            return False
 
-    def fetch_item_price(self) -> float:
-        """Fetches the current price of the item."""
-        return self.item.fetch_price()
+        # MongoDB returns naive datetimes, which are in UTC.
+        last = self.last_notified_at.replace(tzinfo=timezone.utc)
+        return now - last >= timedelta(seconds=cooldown)
 
-    def notify_if_price_reached(self) -> None:
-        """Sends a notification if the target price is reached."""
-        if self.item.price < self.price_floor:
-            print(f'Item {self.item} has reached a price below '
-                  f'{self.price_floor}.\n Latest price: {self.item.price}.')
-            Mailgun.send_mail(['jamesbulk@gmail.com'], 'Test Subj',
-                              'This is a test.', '<p>This is an HTML test.</p>')
+    def _save_state(self, writer: BulkWriter = None) -> None:
+        """Saves only the notification state, leaving user edits intact."""
+        (writer or Database).update_one(
+            self._db_collection, {'_id': self._id},
+            {'armed': self.armed,
+             'last_notified_price': self.last_notified_price,
+             'last_notified_at': self.last_notified_at,
+             'updated_at': datetime.now(timezone.utc)})
+        self._invalidate_cache_after(writer)
 
     def json(self) -> Dict:
         return {
             '_id': self._id,
             'item_name': self.item_name,
             'item_id': self.item_id,
-            'price_limit': self.price_floor,
+            'price_floor': self.price_floor,
             'user_email': self.user_email,
+            'armed': self.armed,
+            'last_notified_price': self.last_notified_price,
+            'last_notified_at': self.last_notified_at,
         }
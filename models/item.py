@@ -4,12 +4,19 @@
 
 import re
 import uuid
-import requests
 
-from bs4 import BeautifulSoup
 from dataclasses import dataclass, field
-from typing import Dict
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import DuplicateKeyError
+from pymongo.operations import UpdateOne
+from requests import Response
+from typing import ClassVar, Dict, List, Optional
 
+from common.database import BulkWriter, Database
+from common.extraction import Extractor
+from common.scheduler import AdaptiveSchedule
+from common.sessions import FetchError, Sessions
+from common.utils import Utils
 from models.model import Model
 
 
@@ -17,41 +24,259 @@ from models.model import Model
 class Item(Model):
     """An item for sale on a retail website.
 
+    Every item is also stored with the canonical form of its url, see
+    Utils.canonical_url, which is unique, so links to the same product share
+    one item.
+
     Attributes:
-        url: The url where the item is located.
+        url: The url where the item is located, as first given by a user.
+            Prices are fetched from it.
         html_tag_name: The html tag enclosing the price.
         html_tag_attributes: The attributes of the HTML tag enclosing the price.
         price: The item's most recent price.
+        price_source: How the most recent price was found on the page. See
+            Extraction.source, or 'not-modified' if the page was unchanged.
+        etag: The ETag validator sent with the page the price came from.
+        last_modified: The Last-Modified validator sent with that page.
+        last_error: Why the most recent fetch failed, if it did.
+        failure_count: The number of consecutive failed fetches.
+        check_interval: The seconds between the item's price checks.
+        last_checked: When the price was last checked.
+        next_check: When the price is next due to be checked.
+        LEASE_SECONDS: How long a worker may hold the items it claims.
     """
 
+    LEASE_SECONDS = 15 * 60
+
     url: str
     html_tag_name: str
     html_tag_attributes: Dict
     price: float = field(default=None)
+    price_source: str = field(default=None)
+    etag: str = field(default=None)
+    last_modified: str = field(default=None)
+    last_error: str = field(default=None)
+    failure_count: int = field(default=0)
+    check_interval: float = field(default=None)
+    last_checked: datetime = field(default=None)
+    next_check: datetime = field(default=None)
     _db_collection: str = field(init=False, default='items')
+    _indexes: ClassVar[List[Dict]] = [
+        {'keys': 'canonical_url', 'unique': True},
+        {'keys': [('next_check', 1), ('lease_expires', 1)]},
+    ]
+    _dropped_indexes: ClassVar[List[str]] = ['url_1', 'next_check_1']
+    _cache_ttl: ClassVar[float] = 30
     _id: str = field(default_factory=lambda: uuid.uuid4().hex)
 
+    @classmethod
+    def find_or_create(cls, url: str, html_tag_name: str,
+                       html_tag_attributes: Dict) -> "Item":
+        """Gets the item for a product URL, creating it if it is new.
+
+        Items are looked up by canonical URL, so links to the same product
+        share one item however they were copied. A new item keeps the URL as
+        given, to fetch its prices from, and has no price yet.
+
+        Args:
+            url: A link to the item.
+            html_tag_name: The html tag enclosing the price, used if the
+                item is new.
+            html_tag_attributes: The attributes of that tag.
+        """
+        document = cls(url.strip(), html_tag_name, html_tag_attributes).json()
+        query = {'canonical_url': document.pop('canonical_url')}
+        document['updated_at'] = datetime.now(timezone.utc)
+        update = {'$setOnInsert': document}
+
+        try:
+            document = Database.find_one_and_update(
+                cls._db_collection, query, update, upsert=True)
+        except DuplicateKeyError:
+            # Another request inserted the same product between this one's
+            # lookup and insert, so the item now exists.
+            document = Database.find_one(cls._db_collection, query)
+
+        cls._invalidate_cache()
+        return cls.from_document(document)
+
     def fetch_price(self) -> float:
-        """Fetches the current price of the item from the website."""
-        response = requests.get(self.url)
-        content = response.content
+        """Fetches the current price of the item from the website.
+
+        Once a price is known, the request is made conditional on the page
+        having changed. An unchanged page keeps the known price and is not
+        parsed.
+
+        Raises:
+            FetchError: If the page could not be fetched or contains no price.
+        """
+        headers = {}
+        if self.price is not None:
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
 
-        soup = BeautifulSoup(content, 'html.parser')
-        element = soup.find(self.html_tag_name, self.html_tag_attributes)
+        with Sessions.for_url(self.url).open(self.url,
+                                             headers=headers) as response:
+            if response.status_code == 304:
+                self.price_source = 'not-modified'
+            else:
+                self._read_price(response)
 
-        self.price = self.parse_price(element.text)
+        self.last_error = None
+        self.failure_count = 0
 
         return self.price
 
+    def _read_price(self, response: Response) -> None:
+        """Extracts the price from a page and keeps its cache validators."""
+        extraction = Extractor.extract(response, self.html_tag_name,
+                                       self.html_tag_attributes)
+
+        if extraction is None:
+            raise FetchError(f'No price element was found at {self.url}.')
+
+        try:
+            self.price = self.parse_price(extraction.text)
+        except AttributeError:
+            raise FetchError(f'No price could be read from {self.url}.')
+
+        self.price_source = extraction.source
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+
+    def record_failure(self, error: FetchError) -> None:
+        """Records a failed fetch, keeping the last known price.
+
+        The next check is put off for longer than the current interval.
+        """
+        self.last_error = error.message
+        self.failure_count += 1
+        self._schedule(AdaptiveSchedule.failure_interval(self.check_interval))
+
+    def reschedule(self, changed: bool, threshold: float = None) -> None:
+        """Schedules the next price check after a successful fetch.
+
+        Args:
+            changed: Whether the price changed at this fetch.
+            threshold: The alert price floor closest to the price, or None
+                if no alert is watching the item.
+        """
+        self._schedule(AdaptiveSchedule.next_interval(
+            self.check_interval, changed, self.price, threshold))
+
+    def check_now(self) -> None:
+        """Makes the item due for a price check, unless it is due already.
+
+        Called when a new alert starts watching the item, so the alert is
+        evaluated at the next update cycle rather than at the item's next
+        scheduled check, which may be a day away.
+        """
+        now = datetime.now(timezone.utc)
+        document = Database.find_one_and_update(
+            self._db_collection, {'_id': self._id, 'next_check': {'$gt': now}},
+            {'$set': {'next_check': now, 'updated_at': now}})
+
+        if document is not None:
+            self.next_check = now
+            self._invalidate_cache()
+
+    def _schedule(self, interval: float) -> None:
+        """Sets the next check to a number of seconds from now."""
+        self.last_checked = datetime.now(timezone.utc)
+        self.check_interval = interval
+        self.next_check = self.last_checked + timedelta(seconds=interval)
+
     def json(self) -> Dict:
         return {
             '_id': self._id,
             'url': self.url,
+            'canonical_url': Utils.canonical_url(self.url),
             'html_tag_name': self.html_tag_name,
             'html_tag_attributes': self.html_tag_attributes,
             'price': self.price,
+            'price_source': self.price_source,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'last_error': self.last_error,
+            'failure_count': self.failure_count,
+            'check_interval': self.check_interval,
+            'last_checked': self.last_checked,
+            'next_check': self.next_check,
         }
 
+    @classmethod
+    def claim_due(cls, worker: str, batch_size: int,
+                  lease_seconds: float = None) -> List["Item"]:
+        """Claims a batch of items whose price is due to be checked.
+
+        Each item is leased to the worker with an atomic update, so workers
+        sharing the items collection never claim the same item. A lease
+        lapses after lease_seconds, letting other workers take over the items
+        of a worker which has died. Items are claimed most overdue first,
+        after any which have never been checked. Claim only as many items as
+        will be fetched soon, since leases are not renewed while items wait.
+
+        Args:
+            worker: A name unique to the claiming worker.
+            batch_size: The most items to claim.
+            lease_seconds: How long the items are leased for.
+
+        Returns:
+            The claimed items. Fewer than batch_size means none are left.
+        """
+        now = datetime.now(timezone.utc)
+        expires = now + timedelta(seconds=lease_seconds or cls.LEASE_SECONDS)
+        query = {'$and': [
+            {'$or': [{'next_check': {'$lte': now}}, {'next_check': None}]},
+            {'$or': [{'lease_expires': {'$lte': now}},
+                     {'lease_expires': None}]},
+        ]}
+        update = {'$set': {'lease_owner': worker, 'lease_expires': expires}}
+
+        items = []
+        for _ in range(batch_size):
+            document = Database.find_one_and_update(
+                cls._db_collection, query, update, sort=[('next_check', 1)])
+            if document is None:
+                break
+            items.append(cls.from_document(document))
+
+        return items
+
+    @classmethod
+    def claim(cls, _id: str, worker: str,
+              lease_seconds: float = None) -> Optional["Item"]:
+        """Claims one item, whether or not it is due, unless it is leased.
+
+        The lease is the same one claim_due takes, so the item is never
+        checked by the worker and by an update cycle at once.
+
+        Args:
+            _id: The unique identifier of the item.
+            worker: A name unique to the claiming worker.
+            lease_seconds: How long the item is leased for.
+
+        Returns:
+            The claimed item, or None if it is leased or does not exist.
+        """
+        now = datetime.now(timezone.utc)
+        expires = now + timedelta(seconds=lease_seconds or cls.LEASE_SECONDS)
+        query = {'_id': _id, '$or': [{'lease_expires': {'$lte': now}},
+                                     {'lease_expires': None}]}
+        update = {'$set': {'lease_owner': worker, 'lease_expires': expires}}
+
+        document = Database.find_one_and_update(cls._db_collection, query,
+                                                update)
+        return None if document is None else cls.from_document(document)
+
+    def release(self, worker: str, writer: BulkWriter) -> None:
+        """Queues the release of the item's lease, if the worker holds it."""
+        writer.append(self._db_collection, UpdateOne(
+            {'_id': self._id, 'lease_owner': worker},
+            {'$unset': {'lease_owner': '', 'lease_expires': ''}}))
+
     @staticmethod
     def parse_price(element: str) -> float:
         """Extracts a price from a string."""
@@ -2,42 +2,135 @@
 
 """A base model which all other models inherit from."""
 
+import copy
+import functools
+import hashlib
+
 from abc import ABCMeta, abstractmethod
-from typing import Dict, List , Type, TypeVar, Union
+from dataclasses import MISSING, fields
+from datetime import datetime, timezone
+from itertools import islice
+from typing import (ClassVar, Dict, Iterable, Iterator, List, NamedTuple,
+                    Optional, Type, TypeVar, Union)
 
-from common.database import Database
+from common.cache import TTLCache
+from common.database import BulkWriter, Database
 
 T = TypeVar('T', bound='Model')
 
 
+class Page(NamedTuple):
+    """One page of objects, in _id order.
+
+    Attributes:
+        objects: The objects on the page.
+        next_after: The _id to pass as after to fetch the next page, or None
+            if this is the last page.
+    """
+
+    objects: List["Model"]
+    next_after: Optional[str]
+
+
 class Model(metaclass=ABCMeta):
     """A base class from which all other models inherit.
 
     Attributes:
+            BATCH_SIZE: The default number of documents streamed per batch.
+            PAGE_SIZE: The default number of objects per page.
             _db_collection: The database collection where this object is stored.
             _id: The unique identifier of this object.
+            _indexes: Index specifications for the collection, as accepted by
+                Database.create_indexes.
+            _dropped_indexes: The names of indexes which _indexes used to
+                declare and which have since been superseded.
+            _cache_ttl: The seconds that reads by fetch_all, fetch_by_id,
+                find_many and find_one are cached for, or 0 to disable caching.
+            _cache_size: The maximum number of cached reads.
+
+    Every save also stores an updated_at timestamp, which is not a field of
+    the model. It versions the document, so clients can be told cheaply
+    whether anything changed; see version and page_version.
     """
 
+    BATCH_SIZE = 500
+    PAGE_SIZE = 25
+
     _db_collection: str
     _id: str
+    _indexes: ClassVar[List[Dict]] = []
+    _dropped_indexes: ClassVar[List[str]] = []
+    _registry: ClassVar[List[Type["Model"]]] = []
+    _cache_ttl: ClassVar[float] = 0
+    _cache_size: ClassVar[int] = 256
+    _caches: ClassVar[Dict[str, TTLCache]] = {}
 
     def __init__(self, *args, **kwargs) -> None:
         pass
 
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        Model._registry.append(cls)
+
+    @classmethod
+    def ensure_indexes(cls) -> None:
+        """Creates the model's declared indexes and drops superseded ones.
+
+        Called on Model itself, creates the indexes of every model. Indexes
+        which already exist are left alone, as are superseded indexes which
+        are already gone, so this is safe to call at every start-up.
+        """
+        models = Model._registry if cls is Model else [cls]
+        for model in models:
+            if model._indexes:
+                Database.create_indexes(model._db_collection, model._indexes)
+            # Superseded indexes are dropped only once their replacements
+            # exist, so queries are never left without an index.
+            for name in model._dropped_indexes:
+                Database.drop_index(model._db_collection, name)
+
+    @classmethod
+    def cache_stats(cls) -> Dict[str, Dict[str, int]]:
+        """Reports the read cache counters of each collection."""
+        return {collection: cache.stats()
+                for collection, cache in Model._caches.items()}
+
     def delete(self):
         """Deletes an object from the database."""
-        return Database.delete_one(self._db_collection, {'_id': self._id})
+        result = Database.delete_one(self._db_collection, {'_id': self._id})
+        self._invalidate_cache()
+        return result
+
+    def save_to_db(self, writer: BulkWriter = None):
+        """Saves the object to the database.
+
+        Args:
+            writer: A bulk writer to queue the save on instead of writing
+                immediately.
+        """
+        document = self.json()
+        document['updated_at'] = datetime.now(timezone.utc)
 
-    def save_to_db(self):
-        """Saves the object to the database."""
-        return Database.update_one(self._db_collection, {'_id': self._id},
-                                   self.json())
+        result = (writer or Database).update_one(
+            self._db_collection, {'_id': self._id}, document)
+        self._invalidate_cache_after(writer)
+        return result
 
     @classmethod
     def fetch_all(cls: Type[T]) -> List[T]:
         """Fetches all objects from the database."""
-        documents = Database.find_many(cls._db_collection, {})
-        return [cls(**document) for document in documents]
+        documents = cls._read_through(('find_many', None), lambda: list(
+            Database.find_many(cls._db_collection, {})))
+        return cls.hydrate(documents)
+
+    @classmethod
+    def iter_all(cls: Type[T], batch_size: int = None,
+                 projection: List[str] = None) -> Iterator[T]:
+        """Streams all objects from the database.
+
+        See iter_many.
+        """
+        return cls._iter({}, batch_size, projection)
 
     @classmethod
     def fetch_by_id(cls: Type[T], _id: str) -> T:
@@ -48,15 +141,213 @@ class Model(metaclass=ABCMeta):
     def find_many(cls: Type[T], attribute: str,
                   value: Union[str, Dict]) -> List[T]:
         """Searches the database for a set of documents."""
-        documents = Database.find_many(cls._db_collection, {attribute: value})
-        return [cls(**document) for document in documents]
+        query = {attribute: value}
+        documents = cls._read_through(('find_many', repr(query)), lambda: list(
+            Database.find_many(cls._db_collection, query)))
+        return cls.hydrate(documents)
+
+    @classmethod
+    def iter_many(cls: Type[T], attribute: str, value: Union[str, Dict],
+                  batch_size: int = None,
+                  projection: List[str] = None) -> Iterator[T]:
+        """Streams a set of objects from the database.
+
+        Documents are read and built one batch at a time, so memory use does
+        not grow with the size of the result set.
+
+        Args:
+            attribute: The attribute to search on.
+            value: The value or query operator to match.
+            batch_size: The number of documents per batch.
+            projection: The fields to load. Objects built from a projection
+                have their other fields set to None and must not be saved.
+
+        Yields:
+            The matching objects.
+        """
+        return cls._iter({attribute: value}, batch_size, projection)
+
+    @classmethod
+    def page(cls: Type[T], query: Dict = None, after: str = None,
+             limit: int = None, projection: List[str] = None) -> Page:
+        """Fetches one page of the objects matching a query.
+
+        Pages are keyed on _id rather than skipped through, so every page
+        costs the same to fetch however deep into the results it is. Page
+        through a filtered query with an index on the filtered fields
+        followed by _id.
+
+        Args:
+            query: The search parameters. Defaults to every object.
+            after: The next_after of the previous page, or None for the
+                first page.
+            limit: The most objects on the page.
+            projection: The fields to load. Objects built from a projection
+                have their other fields set to None and must not be saved.
+
+        Returns:
+            The page of objects.
+        """
+        limit = limit or cls.PAGE_SIZE
+        if projection is not None:
+            projection = ['_id', *projection]
+
+        # One extra document shows whether there is a next page.
+        documents = cls._page_documents(query, after, limit + 1, projection)
+        objects = cls.hydrate(documents[:limit], projection is not None)
+        next_after = objects[-1]._id if len(documents) > limit else None
+
+        return Page(objects, next_after)
+
+    @classmethod
+    def page_version(cls, query: Dict = None, after: str = None,
+                     limit: int = None) -> str:
+        """Fingerprints a page, changing whenever any object on it changes.
+
+        Reads only the _id and updated_at of the page's documents, so it is
+        much cheaper than fetching the page. Takes the same arguments as
+        page.
+        """
+        documents = cls._page_documents(query, after,
+                                        (limit or cls.PAGE_SIZE) + 1,
+                                        ['_id', 'updated_at'])
+        return _fingerprint(documents)
+
+    @classmethod
+    def version(cls, _id: str) -> Optional[str]:
+        """Fingerprints one object, or returns None if it does not exist."""
+        document = Database.find_one(cls._db_collection, {'_id': _id},
+                                     ['_id', 'updated_at'])
+        return None if document is None else _fingerprint([document])
+
+    @classmethod
+    def _page_documents(cls, query: Dict, after: str, limit: int,
+                        projection: List[str]) -> List[Dict]:
+        """Reads the documents of a page, in _id order."""
+        query = dict(query or {})
+        if after is not None:
+            query['_id'] = {'$gt': after}
+
+        return list(Database.find_many(cls._db_collection, query, projection,
+                                       sort=[('_id', 1)]).limit(limit))
 
     @classmethod
     def find_one(cls: Type[T], attribute: str, value: Union[str, Dict]) -> T:
         """Searches the database for a single object."""
-        return cls(**Database.find_one(cls._db_collection, {attribute: value}))
+        query = {attribute: value}
+        document = cls._read_through(('find_one', repr(query)), lambda: (
+            Database.find_one(cls._db_collection, query)))
+        return cls.from_document(document or {})
+
+    @classmethod
+    def from_document(cls: Type[T], document: Dict,
+                      partial: bool = False) -> T:
+        """Builds an object from a database document.
+
+        Keys which are not fields of the model are ignored.
+
+        Args:
+            document: The stored document.
+            partial: Whether the document may be missing fields, which are
+                then set to None.
+        """
+        names = _init_fields(cls)
+        kwargs = {key: value for key, value in document.items()
+                  if key in names}
+
+        if partial:
+            for name, required in names.items():
+                if required and name not in kwargs:
+                    kwargs[name] = None
+
+        return cls(**kwargs)
+
+    @classmethod
+    def hydrate(cls: Type[T], documents: Iterable[Dict],
+                partial: bool = False) -> List[T]:
+        """Builds objects from a set of documents.
+
+        Models with related objects override this to load the relations of
+        the whole set at once.
+        """
+        return [cls.from_document(document, partial) for document in documents]
+
+    @classmethod
+    def _read_through(cls, key: tuple, load):
+        """Reads documents through the model's cache, if it has one.
+
+        Cached documents are copied so callers cannot alter the cache.
+        """
+        if not cls._cache_ttl:
+            return load()
+
+        cache = Model._caches.get(cls._db_collection)
+        if cache is None:
+            cache = Model._caches.setdefault(
+                cls._db_collection, TTLCache(cls._cache_size, cls._cache_ttl))
+
+        return copy.deepcopy(cache.get(key, load))
+
+    @classmethod
+    def _invalidate_cache_after(cls, writer: Optional[BulkWriter]) -> None:
+        """Discards the cached reads once a write has reached the database.
+
+        A write queued on a bulk writer is not visible until the writer
+        flushes, and a read cached before then would hold the old document
+        for the whole ttl, so the cache is cleared after the flush.
+
+        Args:
+            writer: The bulk writer the write was queued on, or None if it
+                was written immediately.
+        """
+        if writer is None:
+            cls._invalidate_cache()
+        else:
+            writer.after_flush(cls._invalidate_cache)
+
+    @classmethod
+    def _invalidate_cache(cls) -> None:
+        """Discards every cached read of the model's collection."""
+        cache = Model._caches.get(cls._db_collection)
+        if cache is not None:
+            cache.clear()
+
+    @classmethod
+    def _iter(cls: Type[T], query: Dict, batch_size: int = None,
+              projection: List[str] = None,
+              sort: List = None) -> Iterator[T]:
+        """Streams the objects matching a query one batch at a time."""
+        batch_size = batch_size or cls.BATCH_SIZE
+        if projection is not None:
+            projection = ['_id', *projection]
+
+        cursor = Database.find_many(cls._db_collection, query, projection,
+                                    batch_size, sort)
+        partial = projection is not None
+
+        while True:
+            batch = list(islice(cursor, batch_size))
+            if not batch:
+                break
+            yield from cls.hydrate(batch, partial)
 
     @abstractmethod
     def json(self) -> Dict:
         """Creates a dict from model attributes which are stored in the db."""
         raise NotImplementedError
+
+
+def _fingerprint(documents: Iterable[Dict]) -> str:
+    """Hashes the _id and updated_at of a sequence of documents."""
+    digest = hashlib.sha1()
+    for document in documents:
+        updated_at = document.get('updated_at')
+        digest.update(f'{document["_id"]}@{updated_at}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _init_fields(model: Type[Model]) -> Dict[str, bool]:
+    """Maps a model's constructor fields to whether each one is required."""
+    return {f.name: f.default is MISSING and f.default_factory is MISSING
+            for f in fields(model) if f.init}
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""Price alert notification outbox."""
+
+import uuid
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import ClassVar, Dict, List
+
+from common.database import BulkWriter, Database
+from libs.mailgun import Mailgun, MailgunException
+from models.model import Model
+
+
+@dataclass(eq=False)
+class Notification(Model):
+    """An email about a triggered alert, waiting in the outbox to be sent.
+
+    Notifications are queued while prices are checked and sent afterwards,
+    many recipients per Mailgun request, so a slow or failing Mailgun never
+    holds up price checks. Claimed notifications are leased to their sender
+    through send_after, like jobs. A failed send is retried with exponential
+    backoff until MAX_ATTEMPTS, after which the notification is marked as
+    failed. Sent and failed notifications are kept for a month.
+
+    Attributes:
+        alert_id: The unique identifier of the triggered alert.
+        user_email: The email address to notify.
+        item_name: The name the user gave the item.
+        item_url: The url where the item is located.
+        price: The price which triggered the alert.
+        price_floor: The alert's price threshold.
+        status: 'pending', 'sending', 'sent' or 'failed'.
+        attempts: The number of times sending has been attempted.
+        send_after: When the notification may next be sent, or when the
+            lease of the sender sending it expires.
+        finished_at: When the notification was sent or given up on.
+        last_error: Why the most recent attempt failed, if it did.
+        LEASE_SECONDS: How long a sender may hold the notifications it claims.
+        MAX_ATTEMPTS: The number of attempts before a notification fails.
+        BACKOFF: The seconds before the first retry, doubled each time.
+        SUBJECT, BODY_TEXT, BODY_HTML: The email templates, filled in with
+            Mailgun recipient variables.
+    """
+
+    LEASE_SECONDS = 5 * 60
+    MAX_ATTEMPTS = 6
+    BACKOFF = 60.0
+    SUBJECT = 'Price alert: %recipient.item_name%'
+    BODY_TEXT = ('%recipient.item_name% is now %recipient.price%, below '
+                 'your alert price of %recipient.price_floor%.\n\n'
+                 '%recipient.item_url%')
+    BODY_HTML = ('<p><a href="%recipient.item_url%">%recipient.item_name%</a> '
+                 'is now %recipient.price%, below your alert price of '
+                 '%recipient.price_floor%.</p>')
+
+    alert_id: str
+    user_email: str
+    item_name: str
+    item_url: str
+    price: float
+    price_floor: float
+    status: str = field(default='pending')
+    attempts: int = field(default=0)
+    send_after: datetime = field(
+        default_factory=lambda: datetime.now(timezone.utc))
+    finished_at: datetime = field(default=None)
+    last_error: str = field(default=None)
+    _db_collection: str = field(init=False, default='notifications')
+    _indexes: ClassVar[List[Dict]] = [
+        {'keys': [('status', 1), ('send_after', 1)]},
+        {'keys': 'finished_at', 'expireAfterSeconds': 30 * 24 * 60 * 60},
+    ]
+    _id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    @classmethod
+    def claim(cls, worker: str, batch_size: int) -> List["Notification"]:
+        """Claims a batch of notifications which are ready to send.
+
+        Args:
+            worker: A name unique to the claiming sender.
+            batch_size: The most notifications to claim.
+
+        Returns:
+            The claimed notifications, longest waiting first.
+        """
+        now = datetime.now(timezone.utc)
+        # A sending notification's send_after is the end of its lease.
+        query = {'status': {'$in': ['pending', 'sending']},
+                 'send_after': {'$lte': now}}
+        update = {'$set': {
+            'status': 'sending', 'worker': worker,
+            'send_after': now + timedelta(seconds=cls.LEASE_SECONDS)}}
+
+        notifications = []
+        for _ in range(batch_size):
+            document = Database.find_one_and_update(
+                cls._db_collection, query, update, sort=[('send_after', 1)])
+            if document is None:
+                break
+            notifications.append(cls.from_document(document))
+
+        return notifications
+
+    @classmethod
+    def send_pending(cls, worker: str,
+                     batch_size: int = Mailgun.MAX_RECIPIENTS) -> int:
+        """Sends every notification which is ready, in batches.
+
+        Args:
+            worker: A name unique to the sender.
+            batch_size: The most notifications claimed and sent at a time.
+
+        Returns:
+            The number of notifications sent.
+        """
+        sent = 0
+
+        while True:
+            batch = cls.claim(worker, batch_size)
+
+            with BulkWriter() as writer:
+                for message in cls._messages(batch):
+                    sent += cls._send(message, writer)
+
+            if len(batch) < batch_size:
+                return sent
+
+    @staticmethod
+    def _messages(notifications: List["Notification"]) \
+            -> List[List["Notification"]]:
+        """Splits notifications into messages with one copy per recipient.
+
+        Recipient variables are keyed by email address, so a user with
+        several triggered alerts is sent one message for each.
+        """
+        messages: List[Dict[str, Notification]] = []
+
+        for notification in notifications:
+            for message in messages:
+                if notification.user_email not in message:
+                    break
+            else:
+                message = {}
+                messages.append(message)
+            message[notification.user_email] = notification
+
+        return [list(message.values()) for message in messages]
+
+    @classmethod
+    def _send(cls, message: List["Notification"], writer: BulkWriter) -> int:
+        """Sends one message and queues its notifications' new states.
+
+        Returns:
+            The number of notifications sent.
+        """
+        now = datetime.now(timezone.utc)
+        variables = {n.user_email: {'item_name': n.item_name,
+                                    'item_url': n.item_url,
+                                    'price': f'{n.price:.2f}',
+                                    'price_floor': f'{n.price_floor:.2f}'}
+                     for n in message}
+
+        try:
+            Mailgun.send_mail(list(variables), cls.SUBJECT, cls.BODY_TEXT,
+                              cls.BODY_HTML, variables)
+            error = None
+        except MailgunException as e:
+            error = e.message
+            print(f'Failed to send {len(message)} notifications: {error}')
+
+        for notification in message:
+            notification.attempts += 1
+            notification.last_error = error
+
+            if error is None:
+                notification.status = 'sent'
+                notification.finished_at = now
+            elif notification.attempts < cls.MAX_ATTEMPTS:
+                notification.status = 'pending'
+                notification.send_after = now + timedelta(
+                    seconds=cls.BACKOFF * 2 ** (notification.attempts - 1))
+            else:
+                notification.status = 'failed'
+                notification.finished_at = now
+
+            notification.save_to_db(writer)
+
+        return 0 if error else len(message)
+
+    def json(self) -> Dict:
+        return {
+            '_id': self._id,
+            'alert_id': self.alert_id,
+            'user_email': self.user_email,
+            'item_name': self.item_name,
+            'item_url': self.item_url,
+            'price': self.price,
+            'price_floor': self.price_floor,
+            'status': self.status,
+            'attempts': self.attempts,
+            'send_after': self.send_after,
+            'finished_at': self.finished_at,
+            'last_error': self.last_error,
+        }
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""Item price history."""
+
+from datetime import datetime, timedelta, timezone
+from pymongo.operations import UpdateOne
+from typing import Dict, List
+
+from common.database import BulkWriter, Database
+
+
+class PriceHistory(object):
+    """An append-only record of every price fetched for each item.
+
+    Observations are bucketed into one document per item per day, so a day of
+    history is a single read. Each observation also updates an hourly and a
+    daily rollup holding the minimum, maximum, sum and count of the prices in
+    that period, so history queries read the rollups rather than every
+    observation.
+
+    Attributes:
+        HISTORY_COLLECTION: The collection holding the daily buckets.
+        ROLLUP_COLLECTION: The collection holding the rollups.
+        PERIODS: The rollup periods kept.
+        INDEXES: Index specifications for each collection.
+    """
+
+    HISTORY_COLLECTION = 'price_history'
+    ROLLUP_COLLECTION = 'price_rollups'
+    PERIODS = ('hour', 'day')
+    INDEXES = {
+        HISTORY_COLLECTION: [{'keys': [('item_id', 1), ('day', 1)]}],
+        ROLLUP_COLLECTION: [{'keys': [('item_id', 1), ('period', 1),
+                                      ('start', 1)]}],
+    }
+
+    @classmethod
+    def ensure_indexes(cls) -> None:
+        """Creates the price history indexes unless they already exist."""
+        for collection, indexes in cls.INDEXES.items():
+            Database.create_indexes(collection, indexes)
+
+    @classmethod
+    def record(cls, item_id: str, price: float, writer: BulkWriter,
+               at: datetime = None) -> None:
+        """Queues a price observation and its rollup updates.
+
+        Args:
+            item_id: The unique identifier of the item.
+            price: The price fetched.
+            writer: The bulk writer to queue the writes on.
+            at: When the price was fetched. Defaults to now.
+        """
+        at = at or datetime.now(timezone.utc)
+        starts = {'hour': at.replace(minute=0, second=0, microsecond=0),
+                  'day': at.replace(hour=0, minute=0, second=0,
+                                    microsecond=0)}
+
+        writer.append(cls.HISTORY_COLLECTION, UpdateOne(
+            {'_id': f'{item_id}:{starts["day"]:%Y%m%d}'},
+            {'$setOnInsert': {'item_id': item_id, 'day': starts['day']},
+             '$push': {'points': {'at': at, 'price': price}},
+             '$inc': {'count': 1}},
+            upsert=True))
+
+        for period in cls.PERIODS:
+            start = starts[period]
+            writer.append(cls.ROLLUP_COLLECTION, UpdateOne(
+                {'_id': f'{item_id}:{period}:{start:%Y%m%d%H}'},
+                {'$setOnInsert': {'item_id': item_id, 'period': period,
+                                  'start': start},
+                 '$min': {'min': price},
+                 '$max': {'max': price},
+                 '$inc': {'sum': price, 'count': 1}},
+                upsert=True))
+
+    @classmethod
+    def rollups(cls, item_id: str, period: str = 'day',
+                since: datetime = None) -> List[Dict]:
+        """Fetches an item's price rollups in chronological order.
+
+        Args:
+            item_id: The unique identifier of the item.
+            period: Either 'hour' or 'day'.
+            since: The earliest period start to include.
+
+        Returns:
+            Dicts with the period's start, min, max, avg and count.
+        """
+        query = {'item_id': item_id, 'period': period}
+        if since is not None:
+            query['start'] = {'$gte': since}
+
+        documents = Database.find_many(cls.ROLLUP_COLLECTION, query).sort(
+            'start', 1)
+
+        return [{'start': document['start'],
+                 'min': document['min'],
+                 'max': document['max'],
+                 'avg': document['sum'] / document['count'],
+                 'count': document['count']}
+                for document in documents]
+
+    @classmethod
+    def lowest(cls, item_id: str, days: int = 30) -> float:
+        """Finds an item's lowest price over a number of days.
+
+        Returns:
+            The lowest price, or None if there is no history for the period.
+        """
+        since = (datetime.now(timezone.utc) - timedelta(days=days)).replace(
+            hour=0, minute=0, second=0, microsecond=0)
+        rollups = cls.rollups(item_id, 'day', since)
+        return min((rollup['min'] for rollup in rollups), default=None)
+
+    @classmethod
+    def points(cls, item_id: str, since: datetime) -> List[Dict]:
+        """Fetches an item's individual price observations.
+
+        Args:
+            item_id: The unique identifier of the item.
+            since: The earliest observation to include.
+
+        Returns:
+            Dicts with the time and price of each observation, oldest first.
+        """
+        day = since.replace(hour=0, minute=0, second=0, microsecond=0)
+        buckets = Database.find_many(cls.HISTORY_COLLECTION,
+                                     {'item_id': item_id,
+                                      'day': {'$gte': day}}).sort('day', 1)
+
+        since = _naive_utc(since)
+        return [point for bucket in buckets for point in bucket['points']
+                if _naive_utc(point['at']) >= since]
+
+
+def _naive_utc(moment: datetime) -> datetime:
+    """Converts a datetime to naive UTC, as returned by PyMongo."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
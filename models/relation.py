@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""Lazily loaded relations between models."""
+
+from typing import Iterable, Type
+
+from models.model import Model
+
+
+class Relation(object):
+    """A reference from one model to another, loaded on first access.
+
+    The related object is cached on the instance and reloaded only if the
+    instance's key attribute changes.
+
+    Attributes:
+        model: The related model.
+        key: The attribute on the instance holding the related object's key.
+        attribute: The attribute on the related model which the key matches.
+    """
+
+    def __init__(self, model: Type[Model], key: str,
+                 attribute: str = '_id') -> None:
+        self.model = model
+        self.key = key
+        self.attribute = attribute
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self._cache = f'_{name}_cache'
+
+    def __get__(self, instance: Model, owner: type):
+        if instance is None:
+            return self
+
+        value = getattr(instance, self.key)
+        cached = instance.__dict__.get(self._cache)
+
+        if cached is None or cached[0] != value:
+            cached = (value, self.model.find_one(self.attribute, value))
+            instance.__dict__[self._cache] = cached
+
+        return cached[1]
+
+    def __set__(self, instance: Model, related: Model) -> None:
+        instance.__dict__[self._cache] = (getattr(instance, self.key), related)
+
+    def prefetch(self, instances: Iterable[Model]) -> None:
+        """Loads the related objects of many instances with a single query.
+
+        Instances which share a key share the same related object.
+        """
+        instances = [instance for instance in instances
+                     if self._cache not in instance.__dict__]
+        values = list({getattr(instance, self.key)
+                       for instance in instances} - {None})
+
+        if not values:
+            return
+
+        related = {getattr(obj, self.attribute): obj for obj in
+                   self.model.find_many(self.attribute, {'$in': values})}
+
+        for instance in instances:
+            value = getattr(instance, self.key)
+            if value in related:
+                self.__set__(instance, related[value])
@@ -2,31 +2,62 @@
 
 """Online retail store manager."""
 
-import re
+import threading
+import time
 import uuid
 
 from dataclasses import dataclass,  field
-from typing import Dict
+from typing import ClassVar, Dict, List
 
+from common.database import BulkWriter
+from common.sessions import Sessions, StoreSession
+from common.utils import Utils
 from models.model import Model
 
 
+class StoreError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+
+class StoreNotFoundError(StoreError):
+    pass
+
+
 @dataclass(eq=False)
 class Store(Model):
     """Represents an online retailer.
 
+    The request limits apply to the store as a whole and are divided
+    between the updater processes; see StoreSession.
+
     Attributes:
         name: The store's name.
         domain: The store's website domain.
         html_tag_name: The name of the HTML tag enclosing the price.
         html_tag_attributes: The attributes of the HTML tag enclosing the price.
+        max_connections: The maximum number of concurrent requests to send.
+        requests_per_second: The sustained request rate allowed for the store.
+        burst: The number of requests allowed in a burst above that rate.
+        connect_timeout: The seconds allowed to connect to the store.
+        read_timeout: The seconds allowed between bytes of a response.
+        max_retries: The number of retries after a transient fetch failure.
     """
 
     name: str
     domain: str
     html_tag_name: str
     html_tag_attributes: Dict
+    max_connections: int = field(default=StoreSession.MAX_CONNECTIONS)
+    requests_per_second: float = field(
+        default=StoreSession.REQUESTS_PER_SECOND)
+    burst: int = field(default=StoreSession.BURST)
+    connect_timeout: float = field(default=StoreSession.CONNECT_TIMEOUT)
+    read_timeout: float = field(default=StoreSession.READ_TIMEOUT)
+    max_retries: int = field(default=StoreSession.MAX_RETRIES)
     _db_collection: str = field(init=False, default='stores')
+    _indexes: ClassVar[List[Dict]] = [{'keys': 'domain'}]
+    _cache_ttl: ClassVar[float] = 300
     _id: str = field(default_factory=lambda: uuid.uuid4().hex)
 
     def json(self) -> Dict:
@@ -36,8 +67,32 @@ class Store(Model):
             'domain': self.domain,
             'html_tag_name': self.html_tag_name,
             'html_tag_attributes': self.html_tag_attributes,
+            'max_connections': self.max_connections,
+            'requests_per_second': self.requests_per_second,
+            'burst': self.burst,
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.read_timeout,
+            'max_retries': self.max_retries,
         }
 
+    def save_to_db(self, writer: BulkWriter = None):
+        """Saves the store and refreshes the store resolver."""
+        result = super().save_to_db(writer)
+        StoreResolver.refresh()
+        return result
+
+    def delete(self):
+        """Deletes the store and refreshes the store resolver."""
+        result = super().delete()
+        StoreResolver.refresh()
+        return result
+
+    def configure_session(self) -> None:
+        """Applies this store's limits to requests to its domain."""
+        Sessions.configure(self.domain, StoreSession(
+            self.max_connections, self.requests_per_second, self.burst,
+            self.connect_timeout, self.read_timeout, self.max_retries))
+
     @classmethod
     def find_by_name(cls, name: str) -> "Store":
         """Finds a store in the database."""
@@ -51,6 +106,67 @@ class Store(Model):
 
     @classmethod
     def find_by_url(cls, url: str) -> "Store":
-        """Finds a store in the database."""
-        pattern = re.compile(r'(https?://.*?/)')
-        return cls.find_by_domain(pattern.search().group(1))
\ No newline at end of file
+        """Finds the store selling the item at a URL.
+
+        Raises:
+            StoreNotFoundError: If no store is registered for the URL's domain.
+        """
+        store = StoreResolver.resolve(url)
+        if store is None:
+            raise StoreNotFoundError('No store has been set up for '
+                                     'this website.')
+        return store
+
+
+class StoreResolver(object):
+    """A process-local index of stores by hostname.
+
+    Every store is loaded once and indexed by the normalized hostname of its
+    domain, so resolving a URL needs no database query. A URL on a subdomain
+    resolves to the store for the closest parent domain. The index is
+    refreshed whenever a store is saved or deleted in this process, and
+    reloaded after TTL seconds to pick up changes made by other processes.
+
+    Attributes:
+        TTL: The number of seconds before the index is reloaded.
+    """
+
+    TTL = 300
+
+    _stores: Dict[str, Store] = None
+    _loaded_at: float = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def resolve(cls, url: str) -> Store:
+        """Finds the store for a URL.
+
+        Returns:
+            The store, or None if no store is registered for the domain.
+        """
+        stores = cls._index()
+        labels = Utils.hostname(url).split('.')
+
+        for i in range(len(labels)):
+            store = stores.get('.'.join(labels[i:]))
+            if store is not None:
+                return store
+
+        return None
+
+    @classmethod
+    def refresh(cls) -> None:
+        """Discards the index so it is reloaded on next use."""
+        with cls._lock:
+            cls._stores = None
+
+    @classmethod
+    def _index(cls) -> Dict[str, Store]:
+        """Gets the index, loading it if it is missing or stale."""
+        with cls._lock:
+            if (cls._stores is None or
+                    time.monotonic() - cls._loaded_at > cls.TTL):
+                cls._stores = {Utils.hostname(store.domain): store
+                               for store in Store.fetch_all()}
+                cls._loaded_at = time.monotonic()
+            return cls._stores
\ No newline at end of file
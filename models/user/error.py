@@ -22,3 +22,7 @@ class InvalidEmailError(UserError):
 
 class IncorrectPasswordError(UserError):
     pass
+
+
+class BusyError(UserError):
+    pass
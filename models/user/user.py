@@ -5,11 +5,12 @@
 import uuid
 
 from dataclasses import dataclass, field
-from typing import Dict, List
+from typing import ClassVar, Dict, List
 
 import models.user.error as UserError
 
 from models.model import Model
+from common.passwords import HasherBusyError, PasswordHasher
 from common.utils import Utils
 
 
@@ -25,6 +26,7 @@ class User(Model):
     email: str
     password: str
     _db_collection: str = field(init=False, default='users')
+    _indexes: ClassVar[List[Dict]] = [{'keys': 'email', 'unique': True}]
     _id: str = field(default_factory=lambda: uuid.uuid4().hex)
 
     @classmethod
@@ -59,6 +61,7 @@ class User(Model):
             InvalidEmailError: If the email address is invalid.
             AlreadyRegisteredError: If there is already an account registered
                                     with this email address.
+            BusyError: If the server is too busy hashing passwords.
         """
         if not Utils.validate_email(email):
             raise UserError.InvalidEmailError('Invalid email.')
@@ -69,7 +72,11 @@ class User(Model):
                                                    ' registered with this'
                                                    'email.')
         except UserError.NotFoundError:
-            User(email, Utils.hash_password(password)).save_to_db()
+            try:
+                password_hash = Utils.hash_password(password)
+            except HasherBusyError as e:
+                raise UserError.BusyError(e.message)
+            User(email, password_hash).save_to_db()
 
         return True
 
@@ -85,13 +92,24 @@ class User(Model):
 
         Raises:
             IncorrectPasswordError: If the user's password is incorrect.
+            BusyError: If the server is too busy hashing passwords.
         """
         user = cls.find_by_email(email)
 
-        if not Utils.verify_password(password, user.password):
+        try:
+            valid, new_hash = PasswordHasher.verify(password, user.password)
+        except HasherBusyError as e:
+            raise UserError.BusyError(e.message)
+
+        if not valid:
             raise UserError.IncorrectPasswordError('Your password '
                                                    'was incorrect.')
 
+        # The stored hash predates the current hashing parameters.
+        if new_hash is not None:
+            user.password = new_hash
+            user.save_to_db()
+
         return True
 
     def json(self) -> Dict:
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+"""Rename the price_limit key of stored alerts to price_floor.
+
+Alerts used to be saved with their price floor under the key price_limit,
+which the Alert model no longer accepts, so such alerts cannot be loaded.
+This renames the key on every alert which still has it. Run it once, before
+starting the app after upgrading.
+"""
+
+from datetime import datetime, timezone
+from pymongo.operations import UpdateMany
+
+from common.database import Database
+from models.alert import Alert
+
+if __name__ == '__main__':
+    result = Database.bulk_write(Alert._db_collection, [UpdateMany(
+        {'price_limit': {'$exists': True}},
+        {'$rename': {'price_limit': 'price_floor'},
+         '$set': {'updated_at': datetime.now(timezone.utc)}})])
+
+    print(f'Renamed price_limit to price_floor on {result.modified_count} '
+          f'alerts.')
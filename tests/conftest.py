@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+"""Shared test fixtures.
+
+Tests which need a database use the db fixture, backed by mongomock, so no
+MongoDB server is required.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The database manager connects lazily, so this server is never contacted.
+os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017/test')
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """Replaces the database with an empty in-memory one."""
+    mongomock = pytest.importorskip('mongomock')
+
+    from common.database import Database
+    from models.model import Model
+
+    monkeypatch.setattr(Database, 'DB',
+                        mongomock.MongoClient().get_database('test'))
+    monkeypatch.setattr(Model, '_caches', {})
+    return Database.DB
+
+
+@pytest.fixture
+def bulk_writes(monkeypatch):
+    """Records the bulk writes sent to the database instead of sending them.
+
+    Returns:
+        A list of (collection, operations) pairs, in the order written.
+    """
+    from common.database import Database
+
+    writes = []
+    monkeypatch.setattr(Database, 'bulk_write', lambda collection, operations:
+                        writes.append((collection, list(operations))))
+    return writes
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for evaluating alerts against a price."""
+
+from datetime import datetime, timedelta, timezone
+
+from models.alert import Alert
+from models.item import Item
+from models.notification import Notification
+
+
+def item_with_floors(price, *floors, armed=True):
+    """Saves an item at a price, watched by one alert per floor."""
+    item = Item('https://example.com/p/1', 'span', {}, price=price)
+    item.save_to_db()
+    for floor in floors:
+        Alert('item', item._id, floor, 'someone@example.com',
+              armed=armed).save_to_db()
+    return item
+
+
+def test_triggered_returns_floors_above_the_price_lowest_first(db):
+    item = item_with_floors(15.0, 40.0, 10.0, 20.0, 15.0)
+
+    triggered = Alert.triggered(item)
+
+    assert [alert.price_floor for alert in triggered] == [20.0, 40.0]
+    assert all(alert.item is item for alert in triggered)
+
+
+def test_floor_below_includes_a_floor_equal_to_the_price(db):
+    item = item_with_floors(15.0, 10.0, 15.0, 20.0)
+
+    assert Alert.floor_below(item._id, 15.0) == 15.0
+    assert Alert.floor_below(item._id, 14.0) == 10.0
+    assert Alert.floor_below(item._id, 5.0) is None
+
+
+def test_rearmed_requires_the_margin_above_the_floor(db):
+    item = item_with_floors(10.05, 10.0, armed=False)
+    assert Alert.rearmed(item) == []
+
+    item.price = 10.1
+    assert [alert.price_floor for alert in Alert.rearmed(item)] == [10.0]
+
+
+def test_rearmed_skips_armed_alerts(db):
+    item = item_with_floors(50.0, 10.0)
+
+    assert Alert.rearmed(item) == []
+
+
+def test_watched_finds_only_items_with_alerts(db):
+    watched = item_with_floors(15.0, 10.0)
+    unwatched = Item('https://example.com/p/2', 'span', {})
+    unwatched.save_to_db()
+
+    assert Alert.watched([watched._id, unwatched._id]) == {watched._id}
+
+
+def reach(alert, price):
+    """Reaches an alert's floor at a price, as a fetch would."""
+    alert.item.price = price
+    return alert.price_reached()
+
+
+def saved_alert(db, item):
+    """Loads the only alert watching an item."""
+    return Alert.from_document(db[Alert._db_collection].find_one(
+        {'item_id': item._id}))
+
+
+def test_an_armed_alert_notifies_once_and_disarms(db):
+    item = item_with_floors(15.0, 20.0)
+    alert = Alert.triggered(item)[0]
+
+    assert reach(alert, 15.0)
+    assert not reach(alert, 14.9)
+
+    saved = saved_alert(db, item)
+    assert not saved.armed
+    assert saved.last_notified_price == 15.0
+    assert db[Notification._db_collection].count_documents({}) == 1
+
+
+def test_a_disarmed_alert_notifies_again_after_a_further_drop(db):
+    item = item_with_floors(15.0, 20.0)
+    alert = Alert.triggered(item)[0]
+    reach(alert, 15.0)
+
+    assert not reach(alert, 15.0 * (1 - Alert.DROP_DELTA) + 0.01)
+    assert reach(alert, 15.0 * (1 - Alert.DROP_DELTA))
+    assert db[Notification._db_collection].count_documents({}) == 2
+
+
+def test_a_disarmed_alert_reminds_after_the_cooldown(db, monkeypatch):
+    monkeypatch.setenv('ALERT_COOLDOWN', '60')
+    item = item_with_floors(15.0, 20.0)
+    alert = Alert.triggered(item)[0]
+    reach(alert, 15.0)
+
+    assert not reach(alert, 15.0)
+
+    alert.last_notified_at -= timedelta(seconds=61)
+    assert reach(alert, 15.0)
+
+
+def test_a_zero_cooldown_never_reminds(db, monkeypatch):
+    monkeypatch.setenv('ALERT_COOLDOWN', '0')
+    item = item_with_floors(15.0, 20.0)
+    alert = Alert.triggered(item)[0]
+    reach(alert, 15.0)
+
+    alert.last_notified_at = datetime.now(timezone.utc) - timedelta(days=365)
+    assert not reach(alert, 15.0)
+
+
+def test_a_rearmed_alert_notifies_at_the_next_crossing(db):
+    item = item_with_floors(15.0, 20.0)
+    alert = Alert.triggered(item)[0]
+    reach(alert, 15.0)
+
+    item.price = 20.0 * (1 + Alert.REARM_MARGIN)
+    rearmed, = Alert.rearmed(item)
+    rearmed.rearm()
+    assert saved_alert(db, item).armed
+
+    assert reach(rearmed, 19.9)
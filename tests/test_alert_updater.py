@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the alert updater's claiming of due items and jobs."""
+
+import threading
+
+from pymongo.operations import UpdateOne
+
+from alert_updater import drain_jobs, due_items, fetch_first_price, run_cycle
+from common.database import BulkWriter
+from common.jobs import JobQueue
+from models.alert import Alert
+from models.item import Item
+
+
+def watched_items(count):
+    """Saves due items, each watched by one alert."""
+    items = []
+    for number in range(count):
+        item = Item(f'https://example.com/p/{number}', 'span', {})
+        item.save_to_db()
+        Alert('item', item._id, 10.0, 'someone@example.com').save_to_db()
+        items.append(item)
+    return items
+
+
+def release(item_id, worker):
+    """The operation which releases an item's lease."""
+    return UpdateOne({'_id': item_id, 'lease_owner': worker},
+                     {'$unset': {'lease_owner': '', 'lease_expires': ''}})
+
+
+def test_items_are_claimed_in_chunks_as_they_are_needed(db, bulk_writes):
+    watched_items(5)
+    stop = threading.Event()
+
+    with BulkWriter() as writer:
+        due = due_items('worker', 2, 60, writer, stop)
+        next(due)
+
+        leased = db[Item._db_collection].count_documents(
+            {'lease_owner': 'worker'})
+        assert leased == 2
+        assert len(list(due)) == 4
+
+
+def test_unstarted_items_are_released_on_stop(db, bulk_writes):
+    watched_items(5)
+    stop = threading.Event()
+
+    with BulkWriter() as writer:
+        due = due_items('worker', 3, 60, writer, stop)
+        started = next(due).item
+        stop.set()
+        assert list(due) == []
+
+    claimed = [document['_id'] for document in db[Item._db_collection].find(
+        {'lease_owner': 'worker'})]
+    unstarted = [_id for _id in claimed if _id != started._id]
+
+    assert len(claimed) == 3
+    assert bulk_writes == [(Item._db_collection, [
+        release(_id, 'worker') for _id in unstarted])]
+
+
+def test_unexpected_errors_are_recorded_against_the_item(db, bulk_writes,
+                                                         monkeypatch):
+    item, = watched_items(1)
+
+    def fetch_price(self):
+        raise AssertionError('unknown status keyword')
+
+    monkeypatch.setattr(Item, 'fetch_price', fetch_price)
+
+    assert run_cycle('worker', 100, 60, threading.Event()) == 1
+
+    saves = [operation for collection, operations in bulk_writes
+             if collection == Item._db_collection
+             for operation in operations
+             if operation._doc.get('$set', {}).get('failure_count') == 1]
+    assert len(saves) == 1
+    assert 'unknown status keyword' in saves[0]._doc['$set']['last_error']
+
+
+def test_no_job_is_claimed_once_stopped(db):
+    job_id = JobQueue.enqueue('fetch_price', item_id='0' * 32)
+    stop = threading.Event()
+    stop.set()
+
+    assert drain_jobs('worker', stop) == 0
+    job = db[JobQueue.COLLECTION].find_one({'_id': job_id})
+    assert job['status'] == 'queued'
+    assert job['attempts'] == 0
+
+
+def test_the_first_price_is_not_fetched_while_a_cycle_holds_the_item(
+        db, bulk_writes, monkeypatch):
+    item, = watched_items(1)
+    Item.claim_due('cycle', 1, 60)
+
+    def fetch_price(self):
+        raise AssertionError('fetched a leased item')
+
+    monkeypatch.setattr(Item, 'fetch_price', fetch_price)
+
+    fetch_first_price(item._id)
+
+    assert bulk_writes == []
+
+
+def test_the_first_price_is_fetched_under_a_lease(db, bulk_writes,
+                                                  monkeypatch):
+    item, = watched_items(1)
+    leases = []
+
+    def fetch_price(self):
+        leases.append(db[Item._db_collection].find_one(
+            {'_id': self._id})['lease_owner'])
+        self.price = 12.0
+
+    monkeypatch.setattr(Item, 'fetch_price', fetch_price)
+
+    fetch_first_price(item._id)
+
+    worker, = leases
+    operations = [operation for collection, operations in bulk_writes
+                  if collection == Item._db_collection
+                  for operation in operations]
+    assert release(item._id, worker) in operations
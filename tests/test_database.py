@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for BulkWriter."""
+
+from pymongo.operations import DeleteOne, UpdateOne
+
+from common.database import BulkWriter
+
+
+def upsert(_id, document):
+    """The operation BulkWriter sends for an upsert."""
+    return UpdateOne({'_id': _id}, {'$set': document}, upsert=True)
+
+
+def test_updates_to_one_document_are_merged(bulk_writes):
+    with BulkWriter() as writer:
+        writer.update_one('items', {'_id': 'a'}, {'price': 1.0, 'etag': 'x'})
+        writer.update_one('items', {'_id': 'a'}, {'price': 2.0})
+        writer.update_one('items', {'_id': 'b'}, {'price': 3.0})
+
+    assert bulk_writes == [('items', [
+        upsert('a', {'price': 2.0, 'etag': 'x'}), upsert('b', {'price': 3.0})])]
+
+
+def test_each_collection_gets_one_bulk_write(bulk_writes):
+    writer = BulkWriter()
+    writer.update_one('items', {'_id': 'a'}, {'price': 1.0})
+    writer.append('alerts', DeleteOne({'_id': 'b'}))
+    writer.update_one('alerts', {'_id': 'c'}, {'armed': False})
+    writer.flush()
+
+    assert sorted(bulk_writes, key=lambda write: write[0]) == [
+        ('alerts', [DeleteOne({'_id': 'b'}), upsert('c', {'armed': False})]),
+        ('items', [upsert('a', {'price': 1.0})]),
+    ]
+
+
+def test_flushes_when_batch_size_documents_are_pending(bulk_writes):
+    writer = BulkWriter(batch_size=2)
+    writer.update_one('items', {'_id': 'a'}, {'price': 1.0})
+    writer.update_one('items', {'_id': 'a'}, {'price': 2.0})
+    assert bulk_writes == []
+
+    writer.update_one('items', {'_id': 'b'}, {'price': 3.0})
+    assert bulk_writes == [('items', [upsert('a', {'price': 2.0}),
+                                      upsert('b', {'price': 3.0})])]
+
+    writer.flush()
+    assert len(bulk_writes) == 1
+
+
+def test_after_flush_runs_once_after_the_writes(bulk_writes):
+    calls = []
+
+    def callback():
+        calls.append(len(bulk_writes))
+
+    writer = BulkWriter()
+    writer.update_one('items', {'_id': 'a'}, {'price': 1.0})
+    writer.after_flush(callback)
+    writer.after_flush(callback)
+    assert calls == []
+
+    writer.flush()
+    writer.flush()
+    assert calls == [1]
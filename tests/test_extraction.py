@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for streaming price extraction."""
+
+import pytest
+
+from common.extraction import Extractor
+from common.sessions import FetchError
+
+
+class StreamedResponse(object):
+    """A stand-in for a streamed requests.Response."""
+
+    def __init__(self, body: bytes, chunk_size: int = None) -> None:
+        self.body = body
+        self.chunk_size = chunk_size
+        self.headers = {'content-type': 'text/html; charset=utf-8'}
+        self.encoding = 'utf-8'
+        self.url = 'https://example.com/p/1'
+        self.read = 0
+
+    def iter_content(self, chunk_size):
+        chunk_size = self.chunk_size or chunk_size
+        for start in range(0, len(self.body), chunk_size):
+            self.read = start + chunk_size
+            yield self.body[start:start + chunk_size]
+
+
+def extract(body, chunk_size=None):
+    return Extractor.extract(StreamedResponse(body, chunk_size), 'span',
+                             {'class': 'price'})
+
+
+def test_finds_the_store_price_element_split_across_chunks():
+    body = b'<html><body><span class="big price">\xc2\xa39.99</span></body>'
+    assert extract(body, chunk_size=7) == ('£9.99', 'selector')
+
+
+def test_stops_reading_once_the_price_is_found():
+    response = StreamedResponse(b'<span class="price">1.00</span>' +
+                                b'<p>filler</p>' * 100000)
+    Extractor.extract(response, 'span', {'class': 'price'})
+    assert response.read < len(response.body)
+
+
+def test_markup_the_incremental_parser_rejects_falls_back_to_structured_data():
+    body = (b'<html><![foo bar]><span class="price">1.00</span>'
+            b'<meta itemprop="price" content="9.99">')
+    assert extract(body, chunk_size=40) == ('9.99', 'microdata')
+
+
+def test_markup_no_parser_accepts_is_a_fetch_error():
+    with pytest.raises(FetchError):
+        extract(b'<html><![foo bar]><span class="price">9.99</span>')
+
+
+def test_a_page_without_the_element_has_no_price():
+    assert extract(b'<html><body><p>Sold out</p></body></html>') is None
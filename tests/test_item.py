@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for finding, claiming, releasing and fetching items."""
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from pymongo.operations import UpdateOne
+
+from common.sessions import Sessions
+from models.item import Item
+from tests.test_extraction import StreamedResponse
+
+
+def add_items(count, **fields):
+    """Saves items which are due for a price check."""
+    items = [Item(f'https://example.com/p/{number}', 'span', {}, **fields)
+             for number in range(count)]
+    for item in items:
+        item.save_to_db()
+    return items
+
+
+def test_workers_never_claim_the_same_item(db):
+    add_items(5)
+
+    first = Item.claim_due('first', 3, 60)
+    second = Item.claim_due('second', 10, 60)
+
+    assert len(first) == 3
+    assert len(second) == 2
+    assert not {item._id for item in first} & {item._id for item in second}
+    assert Item.claim_due('third', 10, 60) == []
+
+
+def test_items_not_yet_due_are_not_claimed(db):
+    add_items(2, next_check=datetime.now(timezone.utc) + timedelta(hours=1))
+
+    assert Item.claim_due('worker', 10, 60) == []
+
+
+def test_lapsed_leases_can_be_claimed_again(db):
+    add_items(2)
+    Item.claim_due('dead', 10, 60)
+
+    db[Item._db_collection].update_many({}, {'$set': {
+        'lease_expires': datetime.now(timezone.utc) - timedelta(seconds=1)}})
+
+    assert len(Item.claim_due('worker', 10, 60)) == 2
+
+
+def test_items_whose_lease_was_removed_can_be_claimed_again(db):
+    add_items(2)
+    claimed = Item.claim_due('worker', 10, 60)
+
+    db[Item._db_collection].update_many(
+        {'lease_owner': 'worker'},
+        {'$unset': {'lease_owner': '', 'lease_expires': ''}})
+
+    assert len(Item.claim_due('other', 10, 60)) == len(claimed)
+
+
+def test_release_only_touches_the_workers_own_lease():
+    item = Item('https://example.com/p/1', 'span', {})
+    operations = []
+
+    class Writer(object):
+        def append(self, collection, operation):
+            operations.append((collection, operation))
+
+    item.release('worker', Writer())
+
+    assert operations == [(Item._db_collection, UpdateOne(
+        {'_id': item._id, 'lease_owner': 'worker'},
+        {'$unset': {'lease_owner': '', 'lease_expires': ''}}))]
+
+
+def test_links_to_one_product_share_an_item_fetched_from_the_first(db):
+    first = Item.find_or_create(
+        'https://www.shop.example/p?id=5&utm_source=mail', 'span', {})
+    second = Item.find_or_create('https://shop.example/p?id=5#reviews',
+                                 'span', {})
+
+    assert second._id == first._id
+    assert second.url == 'https://www.shop.example/p?id=5&utm_source=mail'
+
+
+def test_product_variants_get_their_own_items(db):
+    blue = Item.find_or_create('https://shop.example/p?id=5&tag=blue',
+                               'span', {})
+    red = Item.find_or_create('https://shop.example/p?id=5&tag=red',
+                              'span', {})
+
+    assert blue._id != red._id
+    assert blue.url == 'https://shop.example/p?id=5&tag=blue'
+
+
+def serve(monkeypatch, status_code, body=b'', response_headers=None):
+    """Answers every fetch with one response, recording the request headers.
+
+    Returns:
+        The list the headers of each request are appended to.
+    """
+    requests = []
+
+    class Session(object):
+        @contextmanager
+        def open(self, url, headers):
+            requests.append(headers)
+            response = StreamedResponse(body)
+            response.status_code = status_code
+            response.headers.update(response_headers or {})
+            yield response
+
+    monkeypatch.setattr(Sessions, 'for_url', lambda url: Session())
+    return requests
+
+
+def test_a_first_fetch_is_unconditional_and_keeps_the_validators(
+        monkeypatch):
+    requests = serve(monkeypatch, 200, b'<span>$12.50</span>',
+                     {'ETag': '"v1"',
+                      'Last-Modified': 'Sat, 17 Oct 2026 10:00:00 GMT'})
+    item = Item('https://example.com/p/1', 'span', {},
+                etag='"stale"', last_modified='stale')
+
+    assert item.fetch_price() == 12.5
+    assert requests == [{}]
+    assert item.etag == '"v1"'
+    assert item.last_modified == 'Sat, 17 Oct 2026 10:00:00 GMT'
+
+
+def test_a_not_modified_page_keeps_the_known_price_unparsed(monkeypatch):
+    requests = serve(monkeypatch, 304)
+    item = Item('https://example.com/p/1', 'span', {}, price=12.5,
+                etag='"v1"', last_modified='Sat, 17 Oct 2026 10:00:00 GMT',
+                failure_count=2)
+
+    assert item.fetch_price() == 12.5
+    assert requests == [{
+        'If-None-Match': '"v1"',
+        'If-Modified-Since': 'Sat, 17 Oct 2026 10:00:00 GMT'}]
+    assert item.price_source == 'not-modified'
+    assert item.etag == '"v1"'
+    assert item.failure_count == 0
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the notification outbox."""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from common.database import BulkWriter
+from libs.mailgun import Mailgun, MailgunException
+from models.notification import Notification
+
+
+def notification(user_email, item_name='item'):
+    """Builds a pending notification for a user."""
+    return Notification('0' * 32, user_email, item_name,
+                        'https://example.com/p/1', 9.5, 10.0)
+
+
+@pytest.fixture
+def mailgun(monkeypatch):
+    """Records the messages sent instead of sending them.
+
+    Returns:
+        A list of (recipients, recipient variables) pairs, in the order
+        sent. Appending an exception to the list's failures makes the next
+        send raise it.
+    """
+    class Sent(list):
+        failures = []
+
+    sent = Sent()
+
+    def send_mail(recipients, subject, text, html, variables):
+        if sent.failures:
+            raise sent.failures.pop(0)
+        sent.append((recipients, variables))
+
+    monkeypatch.setattr(Mailgun, 'send_mail', send_mail)
+    return sent
+
+
+def test_messages_hold_each_recipient_once():
+    first = notification('a@example.com', 'first')
+    second = notification('a@example.com', 'second')
+    other = notification('b@example.com')
+
+    assert Notification._messages([first, second, other]) == [
+        [first, other], [second]]
+
+
+def test_pending_notifications_are_batched_and_marked_sent(db, bulk_writes,
+                                                           mailgun):
+    for email in ('a@example.com', 'b@example.com', 'c@example.com'):
+        notification(email).save_to_db()
+
+    assert Notification.send_pending('worker', batch_size=2) == 3
+
+    assert [sorted(recipients) for recipients, _ in mailgun] == [
+        ['a@example.com', 'b@example.com'], ['c@example.com']]
+    assert mailgun[0][1]['a@example.com']['price'] == '9.50'
+    statuses = [operation._doc['$set']['status']
+                for _, operations in bulk_writes for operation in operations]
+    assert statuses == ['sent'] * 3
+
+
+def fail_send(pending, mailgun):
+    """Sends a notification while Mailgun is failing.
+
+    Returns:
+        How long after the send it is next due, in seconds.
+    """
+    mailgun.failures.append(MailgunException('Mailgun is down.'))
+    with BulkWriter() as writer:
+        assert Notification._send([pending], writer) == 0
+    return (pending.send_after - datetime.now(timezone.utc)).total_seconds()
+
+
+def test_failed_sends_back_off_exponentially(bulk_writes, mailgun):
+    pending = notification('a@example.com')
+
+    assert fail_send(pending, mailgun) == pytest.approx(
+        Notification.BACKOFF, abs=1)
+    assert fail_send(pending, mailgun) == pytest.approx(
+        Notification.BACKOFF * 2, abs=1)
+    assert pending.status == 'pending'
+    assert pending.attempts == 2
+    assert pending.last_error == 'Mailgun is down.'
+    assert mailgun == []
+
+
+def test_a_notification_fails_after_its_last_attempt(bulk_writes, mailgun):
+    pending = notification('a@example.com')
+    pending.attempts = Notification.MAX_ATTEMPTS - 1
+
+    fail_send(pending, mailgun)
+
+    assert pending.status == 'failed'
+    assert pending.finished_at is not None
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the password hasher's lock files."""
+
+import os
+
+import pytest
+
+from common.passwords import HasherBusyError, PasswordHasher
+
+
+@pytest.fixture
+def lock_dir(tmp_path, monkeypatch):
+    """Keeps the lock files in a fresh directory, hashing cheaply."""
+    directory = tmp_path / 'locks'
+    monkeypatch.setenv('PASSWORD_LOCK_DIR', str(directory))
+    monkeypatch.setenv('PASSWORD_ROUNDS', '1000')
+    return directory
+
+
+def test_the_lock_directory_is_created_private(lock_dir):
+    hash = PasswordHasher.hash('secret')
+
+    assert PasswordHasher.verify('secret', hash) == (True, None)
+    assert lock_dir.stat().st_mode & 0o077 == 0
+
+
+def test_a_lock_directory_others_can_write_to_is_refused(lock_dir):
+    lock_dir.mkdir()
+    os.chmod(lock_dir, 0o777)
+
+    with pytest.raises(HasherBusyError):
+        PasswordHasher.hash('secret')
+
+
+def test_a_symlinked_lock_file_is_refused(lock_dir, tmp_path):
+    lock_dir.mkdir(0o700)
+    target = tmp_path / 'target'
+    (lock_dir / 'price-watcher-hash-0.lock').symlink_to(target)
+
+    with pytest.raises(HasherBusyError):
+        PasswordHasher.hash('secret')
+    assert not target.exists()
+
+
+def test_an_unopenable_lock_file_is_a_busy_error(lock_dir):
+    lock_dir.mkdir(0o700)
+    (lock_dir / 'price-watcher-hash-0.lock').mkdir()
+
+    with pytest.raises(HasherBusyError):
+        PasswordHasher.hash('secret')
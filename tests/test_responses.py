@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for conditional JSON responses and the versions they send."""
+
+import time
+
+from flask import Flask
+
+from common.responses import conditional_json
+from models.alert import Alert
+
+APP = Flask(__name__)
+
+
+def respond(version, if_none_match=None):
+    """Responds to a request carrying an If-None-Match header, if given.
+
+    Returns:
+        The response and the number of times the data was loaded.
+    """
+    loads = []
+    headers = {'If-None-Match': if_none_match} if if_none_match else {}
+
+    with APP.test_request_context(headers=headers):
+        response = conditional_json(version, lambda: loads.append(1) or [])
+
+    return response, len(loads)
+
+
+def save_alert(price_floor=10.0):
+    """Saves an alert for someone@example.com."""
+    alert = Alert('item', '0' * 32, price_floor, 'someone@example.com')
+    alert.save_to_db()
+    return alert
+
+
+def test_a_first_request_loads_the_data_and_sends_the_etag():
+    response, loads = respond('v1')
+
+    assert response.status_code == 200
+    assert loads == 1
+    assert response.get_etag() == ('v1', False)
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+
+def test_a_current_copy_is_not_modified_and_never_loaded():
+    response, loads = respond('v1', '"v1"')
+
+    assert response.status_code == 304
+    assert loads == 0
+    assert response.get_etag() == ('v1', False)
+
+
+def test_a_stale_copy_is_sent_the_new_data():
+    response, loads = respond('v2', '"v1"')
+
+    assert response.status_code == 200
+    assert loads == 1
+
+
+def test_a_page_version_changes_when_an_alert_on_it_is_saved(db):
+    alert = save_alert()
+    before = Alert.page_version({'user_email': 'someone@example.com'})
+
+    # MongoDB keeps timestamps to the millisecond.
+    time.sleep(0.002)
+    alert.price_floor = 8.0
+    alert.save_to_db()
+
+    assert Alert.page_version({'user_email': 'someone@example.com'}) != before
+
+
+def test_a_page_version_ignores_other_pages(db):
+    save_alert()
+    before = Alert.page_version({'user_email': 'someone@example.com'})
+
+    Alert('item', '0' * 32, 10.0, 'other@example.com').save_to_db()
+
+    assert Alert.page_version({'user_email': 'someone@example.com'}) == before
+
+
+def test_the_version_of_a_deleted_object_is_none(db):
+    alert = save_alert()
+    assert Alert.version(alert._id) is not None
+
+    alert.delete()
+
+    assert Alert.version(alert._id) is None
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for store sessions."""
+
+import http.server
+import socket
+import threading
+
+import pytest
+
+from common.sessions import StoreSession
+
+
+@pytest.fixture
+def server():
+    """Serves pages of a requested size, counting the connections made."""
+    connections = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            connections.append(self.client_address)
+            super().setup()
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_GET(self):
+            body = b'<span class="price">1.00</span>' + b'x' * int(
+                self.path.strip('/'))
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_port}', connections
+    httpd.shutdown()
+
+
+def read_start(session, url, times):
+    """Reads only the first chunk of a page, several times."""
+    for _ in range(times):
+        with session.open(url) as response:
+            next(response.iter_content(1024))
+
+
+def test_a_small_unread_rest_is_drained_to_keep_the_connection(server):
+    base, connections = server
+    read_start(StoreSession(requests_per_second=1000, burst=1000),
+               f'{base}/{StoreSession.DRAIN_BYTES // 2}', 5)
+    assert len(connections) == 1
+
+
+def test_a_large_unread_rest_closes_the_connection(server):
+    base, connections = server
+    read_start(StoreSession(requests_per_second=1000, burst=1000),
+               f'{base}/{StoreSession.DRAIN_BYTES * 4}', 3)
+    assert len(connections) == 3
+
+
+def test_store_limits_are_shared_between_workers(monkeypatch):
+    monkeypatch.setenv('UPDATER_WORKERS', '4')
+    session = StoreSession(max_connections=6, requests_per_second=2.0,
+                           burst=2)
+
+    assert session._bucket.rate == 0.5
+    assert session._bucket.capacity == 1
+    assert session.session.get_adapter('https://')._pool_maxsize == 1
+    assert session.limits[:3] == (6, 2.0, 2)
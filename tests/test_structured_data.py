@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for structured price data."""
+
+import json
+
+import pytest
+
+from common.extraction import Extractor, StructuredDataScanner
+from tests.test_extraction import StreamedResponse
+
+
+def json_ld(data):
+    return (b'<script type="application/ld+json">' +
+            json.dumps(data).encode('utf-8') + b'</script>')
+
+
+def scan(body):
+    return StructuredDataScanner().scan(body)
+
+
+@pytest.mark.parametrize('data, price', [
+    ({'@type': 'Product', 'offers': {'@type': 'Offer', 'price': '19.99'}},
+     '19.99'),
+    ({'@type': 'Product', 'offers': [{'price': 5}]}, '5.00'),
+    ({'@graph': [{'@type': 'WebPage'},
+                 {'@type': ['Product'],
+                  'offers': {'@type': 'AggregateOffer', 'lowPrice': 7}}]},
+     '7.00'),
+    ({'@type': 'ItemPage',
+      'mainEntity': {'@type': 'Product',
+                     'offers': {'priceSpecification': {'price': '8.5'}}}},
+     '8.50'),
+])
+def test_reads_the_offer_price_of_the_pages_product(data, price):
+    assert scan(json_ld(data)) == (price, 'json-ld')
+
+
+def test_skips_prices_of_related_products():
+    assert scan(json_ld({
+        '@type': 'Product',
+        'isRelatedTo': {'@type': 'Product', 'offers': {'price': 1}},
+        'isSimilarTo': [{'@type': 'Product', 'offers': {'price': 2}}],
+        'offers': {'price': '30.00'}})) == ('30.00', 'json-ld')
+    assert scan(json_ld({
+        '@type': 'ItemList',
+        'itemListElement': [{'@type': 'Product',
+                             'offers': {'price': 3}}]})) is None
+
+
+@pytest.mark.parametrize('price', ['1.299,00', '12,99', '1,299.00', '$5',
+                                   '', True])
+def test_ignores_prices_which_are_not_plain_decimals(price):
+    assert scan(json_ld({'@type': 'Product',
+                         'offers': {'price': price}})) is None
+    assert scan(b'<meta property="product:price:amount" '
+                b'content="%s">' % str(price).encode()) is None
+
+
+def test_reads_open_graph_prices():
+    assert scan(b'<meta property="product:price:amount" content="45.5">') \
+        == ('45.50', 'open-graph')
+
+
+def test_microdata_ranks_below_the_store_price_element():
+    body = (b'<div itemscope><meta itemprop="price" content="1.00"></div>'
+            b'<span class="price">9.99</span>')
+    response = StreamedResponse(body)
+    assert Extractor.extract(response, 'span', {'class': 'price'}) == \
+        ('9.99', 'selector')
+
+
+def test_microdata_is_used_when_the_store_price_element_is_missing():
+    response = StreamedResponse(b'<meta itemprop="price" content="12,99">'
+                                b'<meta itemprop="price" content=\'4.5\'>')
+    assert Extractor.extract(response, 'span', {'class': 'price'}) == \
+        ('4.50', 'microdata')
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the common helper utilities."""
+
+import pytest
+
+from common.utils import Utils
+
+URLS = [
+    'https://www.Example.com/p/1',
+    'HTTPS://WWW.EXAMPLE.COM:443/p//1/?b=2&a=1#reviews',
+    'http://example.com:8080/p/1?utm_source=mail&id=7',
+    'example.com/p/1?q=a+b&q=%26',
+    '  https://example.com/?ref=home&tag=x-21  ',
+    'https://example.com/p/%C3%A9?name=caf%C3%A9',
+    'https://example.com./p/1?pd_rd_w=abc&color=',
+    'https://shop.example/p//1/',
+]
+
+
+@pytest.mark.parametrize('url', URLS)
+def test_canonical_url_is_idempotent(url):
+    canonical = Utils.canonical_url(url)
+    assert Utils.canonical_url(canonical) == canonical
+
+
+def test_canonical_url_makes_copies_of_a_link_equal():
+    assert len({Utils.canonical_url(url) for url in [
+        'https://www.example.com/p/1?id=7&size=m',
+        'HTTPS://EXAMPLE.com:443/p/1?size=m&id=7',
+        'https://www.example.com/p/1?size=m&utm_medium=email&id=7#top',
+        'https://example.com./p/1?fbclid=x&id=7&size=m&gclid=y',
+    ]}) == 1
+
+
+@pytest.mark.parametrize('first, second', [
+    ('https://shop.example/p?id=5&tag=blue', 'https://shop.example/p?id=5'),
+    ('https://shop.example/p?ref=sale', 'https://shop.example/p'),
+    ('https://shop.example/p?spm=a&affiliate=b', 'https://shop.example/p'),
+    ('https://shop.example/p/', 'https://shop.example/p'),
+    ('https://example.com:8443/p/1', 'https://example.com/p/1'),
+])
+def test_canonical_url_keeps_what_may_identify_the_product(first, second):
+    assert Utils.canonical_url(first) != Utils.canonical_url(second)
+
+
+def test_canonical_url_and_hostname_agree_on_the_host():
+    url = 'https://WWW.Shop.example/p?id=5&tag=blue&color=red'
+    assert Utils.canonical_url(url) == \
+        'https://shop.example/p?color=red&id=5&tag=blue'
+    assert Utils.hostname(url) == 'shop.example'